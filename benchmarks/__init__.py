@@ -0,0 +1 @@
+"""Offline benchmarks; run each module with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,59 @@
+"""Per-city min-max normalization: groupby lambdas vs the vectorized kernels.
+
+    python -m benchmarks.normalize [--rows 792] [--repeat 5]
+
+The base size is one city-month trend frame (6 cities x 11 years x 12 months);
+the 10x and 100x runs add cities, which is how the table grows.
+"""
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from core.kernels import normalize_by_codes, normalize_by_group
+
+ROWS_PER_CITY = 132
+
+
+def make_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    cities = max(rows // ROWS_PER_CITY, 1)
+    return pd.DataFrame({
+        "CITY": pd.Categorical(np.repeat([f"City {i}" for i in range(cities)], rows // cities)),
+        "TOTAL_CRIMES": rng.poisson(500, size=cities * (rows // cities)).astype("float64"),
+    })
+
+
+def lambda_normalize(df):
+    return df.groupby("CITY", observed=True)["TOTAL_CRIMES"].transform(
+        lambda x: (x - x.min()) / (x.max() - x.min())
+    )
+
+
+def run(base_rows, repeat):
+    print(f"{'rows':>10} {'lambda ms':>10} {'groupby ms':>11} {'numpy ms':>9} {'speedup':>8}")
+    for scale in (1, 10, 100):
+        df = make_frame(base_rows * scale)
+        codes = df["CITY"].cat.codes.to_numpy()
+        expected = lambda_normalize(df)
+        pd.testing.assert_series_equal(normalize_by_group(df, "CITY", "TOTAL_CRIMES"), expected, check_names=False)
+        np.testing.assert_allclose(normalize_by_codes(codes, df["TOTAL_CRIMES"]), expected.to_numpy())
+
+        timings = [
+            min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+            for fn in (
+                lambda: lambda_normalize(df),
+                lambda: normalize_by_group(df, "CITY", "TOTAL_CRIMES"),
+                lambda: normalize_by_codes(codes, df["TOTAL_CRIMES"]),
+            )
+        ]
+        print(f"{len(df):>10} {timings[0]:>10.2f} {timings[1]:>11.2f} {timings[2]:>9.2f} {timings[0] / timings[1]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=6 * ROWS_PER_CITY)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
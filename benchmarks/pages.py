@@ -0,0 +1,239 @@
+"""Filter and aggregation paths of every page, timed headlessly on synthetic data.
+
+    python -m benchmarks.pages [--scales 1 10 100] [--repeat 5] [--output FILE]
+    python -m benchmarks.pages --compare BASELINE RESULTS [--tolerance 0.2]
+
+For each scale, the table from benchmarks.synthetic is written to a temporary
+Parquet snapshot, streamed into memory from it as the dashboard loads
+data_source = "parquet", and indexed as core/index.py does. Then the data
+functions each page draws its charts from (core/page_data.py) run in local
+mode for the sidebar defaults and for a narrow selection, with the aggregate
+cache cleared before every run. A step's time is the best of --repeat runs. Its
+memory peak comes from one more run under tracemalloc, which traces Python
+and numpy allocations but not Arrow buffers.
+
+Results are JSON lines, one per (scale, page, filters, step), written under
+data/benchmarks/ unless --output is given. --compare matches two result files
+on those keys and exits with status 1 when a step is more than --tolerance
+slower than in the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+## Rollups on disk are built from the real table, not the synthetic one
+os.environ["DASHBOARD_ROLLUPS"] = "off"
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.synthetic import iter_batches
+from core.data import TableVersion
+from core.dimensions import _income, load_income
+from core.index import SORT_KEYS, _index, load_index
+from core.memo import AGGREGATE_CACHE
+from core.page_data import (
+    crime_category_data, crime_time_data, heatmap_data, income_box_data, income_city_data, income_trend_data,
+    insights_city_data, insights_trend_data,
+)
+from core.periods import high_water_mark
+from core.query import ALL_CATEGORIES, DataQuery, Filters
+from core.schema import COLUMNS
+from core.snapshot import scan_snapshot, write_snapshot
+from core.stream import stream_frame
+
+RESULTS_DIR = os.path.join("data", "benchmarks")
+## Steps faster than this are too noisy to flag as regressions
+MIN_DELTA_MS = 1.0
+
+
+## Page -> (the page's data functions, whether they read the income dimension)
+PAGES = {
+    "Key Insights": ([insights_city_data, insights_trend_data], False),
+    "Crime": ([crime_time_data, crime_category_data], False),
+    "Income": ([income_city_data, income_box_data, income_trend_data], True),
+    "Heatmaps": ([heatmap_data], False),
+}
+
+
+## Sidebar defaults, and one city, year and offense category
+def scenarios(table):
+    frame = table.frame
+    years = (int(frame["YEAR"].min()), int(frame["YEAR"].max()))
+    cities = tuple(frame["CITY"].cat.categories)
+    return {
+        "default": Filters((2018, years[1]), (1, 12), cities, ALL_CATEGORIES),
+        "narrow": Filters((years[1], years[1]), (1, 12), cities[:1], str(frame["OFFENSE_CATEGORY"].cat.categories[0])),
+    }
+
+
+def _rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    if isinstance(result, (list, tuple)):
+        return sum(_rows(part) for part in result)
+    if isinstance(result, dict):
+        return _rows(list(result.values()))
+    return None
+
+
+## Best and median milliseconds of `repeat` runs of step(), then the peak MB
+## allocated by one traced run. setup() runs untimed before each run.
+def measure(step, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result_rows = _rows(step())
+        timings.append((time.perf_counter() - start) * 1000)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        step()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "best_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "peak_mb": round(peak / 2**20, 3),
+        "result_rows": result_rows,
+    }
+
+
+def environment(seed):
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+        "seed": seed,
+    }
+
+
+## The table at `scale`, loaded from a snapshot as core.data.stream_source
+## does, and the load's measurements
+def load_table(scale, seed):
+    loaded = {}
+    with tempfile.TemporaryDirectory() as path:
+        rows = write_snapshot(iter_batches(scale, seed), path)
+
+        def load():
+            loaded["frame"] = stream_frame(scan_snapshot(COLUMNS, path)[1], rows, sort_by=SORT_KEYS)[0]
+            return loaded["frame"]
+
+        stats = measure(load, 1, setup=loaded.clear)
+    return loaded["frame"], stats
+
+
+## One result record per step at `scale`
+def run_scale(scale, repeat, seed):
+    frame, load_stats = load_table(scale, seed)
+    base = {"scale": scale, "rows": len(frame), **environment(seed)}
+
+    def record(page, filters, step, stats):
+        return {**base, "page": page, "filters": filters, "step": step, **stats}
+
+    yield record("(table)", None, "load", load_stats)
+    mark = high_water_mark(frame)
+    table = TableVersion(frame, mark, mark)
+    yield record("(table)", None, "index", measure(lambda: load_index(table).df, repeat, setup=_index.clear))
+    yield record("(table)", None, "income dimension", measure(lambda: load_income(table), repeat, setup=_income.clear))
+    load_index(table)
+    load_income(table)
+
+    for label, filters in scenarios(table).items():
+        for page, (functions, reads_income) in PAGES.items():
+            def view():
+                query = DataQuery(filters, "local", table=table)
+                return query, query.income if reads_income else query
+
+            yield record(page, label, "filter", measure(lambda: view()[1].frame, repeat))
+
+            state = {}
+
+            def prepare():
+                AGGREGATE_CACHE.clear()
+                state["query"], filtered = view()
+                filtered.frame
+
+            def requests():
+                return [function(state["query"]) for function in functions]
+
+            yield record(page, label, "aggregate", measure(requests, repeat, setup=prepare))
+
+
+def describe(result):
+    where = result["page"] if result["filters"] is None else f"{result['page']} / {result['filters']}"
+    return (
+        f"{result['scale']:>4}x {result['rows']:>11,} rows  {where:<24} {result['step']:<17}"
+        f"{result['best_ms']:>10.2f} ms {result['peak_mb']:>9.2f} MB"
+    )
+
+
+def run(scales, repeat, seed, output):
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as results:
+        for scale in scales:
+            for result in run_scale(scale, repeat, seed):
+                results.write(json.dumps(result) + "\n")
+                results.flush()
+                print(describe(result))
+    print(f"Wrote {output}")
+
+
+def _key(result):
+    return result["scale"], result["page"], result["filters"], result["step"]
+
+
+def read_results(path):
+    with open(path) as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+## Prints current vs baseline per step; returns the number of regressions
+def compare(baseline_path, current_path, tolerance):
+    baseline = {_key(result): result for result in read_results(baseline_path)}
+    regressions = 0
+    print(f"{'step':<58} {'baseline ms':>12} {'ms':>10} {'change':>8} {'MB change':>10}")
+    for result in read_results(current_path):
+        before = baseline.get(_key(result))
+        if before is None:
+            continue
+        change = result["best_ms"] / before["best_ms"] - 1 if before["best_ms"] else 0.0
+        memory = result["peak_mb"] - before["peak_mb"]
+        flags = []
+        if change > tolerance and result["best_ms"] - before["best_ms"] > MIN_DELTA_MS:
+            flags.append("SLOWER")
+            regressions += 1
+        if result["result_rows"] != before["result_rows"]:
+            flags.append("DIFFERENT RESULT")
+        where = f"{result['scale']}x {result['page']} / {result['filters'] or '-'} / {result['step']}"
+        print(
+            f"{where:<58} {before['best_ms']:>12.2f} {result['best_ms']:>10.2f} {change:>+8.0%} {memory:>+10.2f}"
+            + (f"  {' '.join(flags)}" if flags else "")
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, f"pages-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"))
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"))
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.tolerance) else 0)
+    run(args.scales, args.repeat, args.seed, args.output)
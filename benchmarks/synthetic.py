@@ -0,0 +1,116 @@
+"""FINAL_CRIME_WITH_LATLON-shaped data for benchmarks, without Snowflake.
+
+    python -m benchmarks.synthetic [--scale 1] [--seed 0] [--path data/snapshot]
+
+Scale 1 is 6 cities x 25 ZIP codes x 11 years x 12 months x 8 offense
+categories (158,400 rows); larger scales add cities, which is how the table
+grows. As in the source, HOUSEHOLDS, HOUSEHOLDS_MEDIAN_INCOME and the bracket
+shares are yearly per ZIP and repeated on every month and offense-category
+row. Rows are generated one block of cities at a time, so even the largest
+scales never hold the whole source in memory. With --path the table is
+written as a Parquet snapshot (core/snapshot.py) that the dashboard reads
+with data_source = "parquet".
+"""
+import argparse
+
+import numpy as np
+import pyarrow as pa
+
+from core.schema import INCOME_BRACKET_COLUMNS
+from core.snapshot import SNAPSHOT_DIR, write_snapshot
+
+CITY_CENTERS = {
+    "Chicago": (41.88, -87.63),
+    "Houston": (29.76, -95.37),
+    "Los Angeles": (34.05, -118.24),
+    "New York": (40.71, -74.01),
+    "San Francisco": (37.77, -122.42),
+    "Seattle": (47.61, -122.33),
+}
+OFFENSE_CATEGORIES = [
+    "Assault", "Burglary", "Drug Offense", "Fraud", "Larceny", "Robbery", "Vandalism", "Vehicle Theft",
+]
+## Relative frequency of each offense category
+CATEGORY_WEIGHTS = np.array([1.5, 0.8, 0.6, 0.5, 2.5, 0.4, 0.9, 0.7])
+YEARS = range(2011, 2022)
+MONTHS = range(1, 13)
+ZIPS_PER_CITY = 25
+
+
+def _strings(names, codes):
+    return pa.array(names).take(pa.array(codes))
+
+
+## Rows of one block of cities; block 0 is the real cities, later blocks are
+## placed at random across the continental US
+def _block(block, seed, zips_per_city):
+    rng = np.random.default_rng([seed, block])
+    if block == 0:
+        cities = list(CITY_CENTERS)
+        centers = np.array(list(CITY_CENTERS.values()))
+    else:
+        first = block * len(CITY_CENTERS) + 1
+        cities = [f"City {i}" for i in range(first, first + len(CITY_CENTERS))]
+        centers = np.column_stack([rng.uniform(26, 48, len(cities)), rng.uniform(-123, -71, len(cities))])
+    years, months, categories = len(YEARS), len(MONTHS), len(OFFENSE_CATEGORIES)
+
+    ## One entry per ZIP
+    zips = len(cities) * zips_per_city
+    zip_codes = [f"{10001 + block * zips + i:05d}" for i in range(zips)]
+    zip_city = np.repeat(np.arange(len(cities)), zips_per_city)
+    zip_lat = centers[zip_city, 0] + rng.normal(0, 0.05, zips)
+    zip_lng = centers[zip_city, 1] + rng.normal(0, 0.05, zips)
+    zip_households = rng.integers(1_000, 25_000, zips).astype("float64")
+    zip_income = rng.lognormal(np.log(70_000), 0.4, zips)
+    zip_crime_rate = rng.gamma(2.0, 4.0, zips)
+
+    ## One entry per ZIP-year
+    zip_year = np.repeat(np.arange(zips), years)
+    year_offset = np.tile(np.arange(years), zips)
+    income = zip_income[zip_year] * (1 + rng.normal(0.03, 0.01, zips * years)) ** year_offset
+    households = zip_households[zip_year] * (1 + rng.normal(0, 0.02, zips * years))
+    brackets = rng.dirichlet(np.ones(len(INCOME_BRACKET_COLUMNS)), zips * years) * 100
+
+    ## One entry per row: ZIP-year x month x offense category
+    row_zip_year = np.repeat(np.arange(zips * years), months * categories)
+    row_zip = zip_year[row_zip_year]
+    row_month = np.tile(np.repeat(np.arange(months), categories), zips * years)
+    row_category = np.tile(np.arange(categories), zips * years * months)
+    season = 1 + 0.2 * np.sin((row_month - 3) * np.pi / 6)
+    crimes = rng.poisson(zip_crime_rate[row_zip] * CATEGORY_WEIGHTS[row_category] * season)
+
+    return pa.RecordBatch.from_pydict({
+        "CITY": _strings(cities, zip_city[row_zip]),
+        "ZIP": _strings(zip_codes, row_zip),
+        "LAT": zip_lat[row_zip],
+        "LNG": zip_lng[row_zip],
+        "YEAR": YEARS[0] + year_offset[row_zip_year],
+        "MONTH1": MONTHS[0] + row_month,
+        "OFFENSE_CATEGORY": _strings(OFFENSE_CATEGORIES, row_category),
+        "TOTAL_CRIMES": crimes,
+        "HOUSEHOLDS": np.round(households[row_zip_year]),
+        "HOUSEHOLDS_MEDIAN_INCOME": np.round(income[row_zip_year]),
+        **{col: brackets[row_zip_year, i] for i, col in enumerate(INCOME_BRACKET_COLUMNS)},
+    })
+
+
+## The source table at `scale` as record batches of the Arrow result
+## Snowflake would return (plain strings, 64-bit numbers), one per block of
+## cities. A seed gives the same rows for the cities every scale shares.
+def iter_batches(scale=1, seed=0, zips_per_city=ZIPS_PER_CITY):
+    for block in range(scale):
+        yield _block(block, seed, zips_per_city)
+
+
+def make_table(scale=1, seed=0, zips_per_city=ZIPS_PER_CITY):
+    return pa.Table.from_batches(list(iter_batches(scale, seed, zips_per_city)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--path", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+    rows = write_snapshot(iter_batches(args.scale, args.seed), args.path)
+    print(f"Wrote {rows:,} synthetic rows (scale {args.scale}) to {args.path}")
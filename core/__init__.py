@@ -0,0 +1 @@
+"""Shared data and filtering code used by every dashboard page."""
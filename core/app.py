@@ -0,0 +1,72 @@
+"""Bootstrap shared by every page.
+
+    query = start_page("Crime")
+
+configures the page, starts profiling the rerun (core/profiling.py), renders
+the filter sidebar and returns a DataQuery for the selected filters. The
+sidebar's bounds and options come from load_domain(), which is computed once
+per table version and shared by every page and session, so page switches and
+reruns never rescan the table for them.
+"""
+import os
+
+import streamlit as st
+
+from core.data import describe_memory, invalidate_data, load_domain
+from core.memo import describe_cache
+from core.profiling import start_rerun
+from core.query import ALL_CATEGORIES, DataQuery, Filters
+
+os.environ["OBJC_DISABLE_INITIALIZE_FORK_SAFETY"] = "YES"
+
+DEFAULT_FIRST_YEAR = 2018
+
+
+## Sidebar widget values (by session_state key) before the user changes them
+def default_filters(domain):
+    return {
+        "selected_year": (DEFAULT_FIRST_YEAR, domain["years"][1]),
+        "selected_month": (1, 12),
+        "selected_city": domain["cities"],
+        "selected_offense_category": ALL_CATEGORIES,
+    }
+
+
+def reset_filters(domain):
+    for key, value in default_filters(domain).items():
+        st.session_state[key] = value
+
+
+## Widgets read their values from session_state, which keeps the selection
+## across pages
+def filter_sidebar(domain):
+    for key, value in default_filters(domain).items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+    st.sidebar.title("Filters")
+    selectyear = st.sidebar.slider("Year", domain["years"][0], domain["years"][1], key="selected_year")
+    selectmonth = st.sidebar.slider("Month", domain["months"][0], domain["months"][1], key="selected_month")
+    city = st.sidebar.multiselect("Select City", options=domain["cities"], key="selected_city")
+    off_cat = st.sidebar.selectbox(
+        "Select Offense Category", options=[ALL_CATEGORIES] + domain["offense_categories"], key="selected_offense_category"
+    )
+    return Filters(tuple(selectyear), tuple(selectmonth), tuple(city), off_cat)
+
+
+def start_page(name):
+    st.set_page_config(page_title="US Income vs Crime Dashboard", layout="wide")
+    st.markdown("<h1 style='text-align: center;'>US Income vs Crime Dashboard</h1>", unsafe_allow_html=True)
+    start_rerun(name)
+
+    domain = load_domain()
+    query = DataQuery(filter_sidebar(domain))
+
+    if st.sidebar.checkbox("Show table"):
+        st.write(query.rows(limit=5))
+        st.caption(describe_memory())
+        st.caption(describe_cache())
+
+    st.sidebar.button("Reset Filters", on_click=reset_filters, args=(domain,))
+    st.sidebar.button("Refresh Data", on_click=invalidate_data)
+    return query
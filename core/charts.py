@@ -0,0 +1,99 @@
+"""Server-side reduction of chart data before it is sent to the browser.
+
+Altair ships every row a chart is given, so line charts are downsampled with
+Largest-Triangle-Three-Buckets (which keeps the visual shape of each series)
+and box plots are drawn from precomputed quartiles, whiskers and outliers
+instead of raw rows. chart_point_budget bounds the points one chart draws,
+except that no series is ever dropped to meet it: a chart that still goes
+over is drawn with a caption saying so.
+"""
+import numpy as np
+import pandas as pd
+
+from core.config import get_setting
+from core.periods import month_index
+
+## Most points one chart draws; 0 turns downsampling off
+CHART_POINT_BUDGET = get_setting("chart_point_budget", 2000, int)
+
+
+## Positions of the `threshold` points of a series (sorted by x) that LTTB
+## keeps; the first and last points are always among them
+def lttb_indices(x, y, threshold):
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])
+    x = np.asarray(x, dtype="float64")
+    y = np.nan_to_num(np.asarray(y, dtype="float64"))
+    every = (n - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype="int64")
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        ## Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_stop = min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+        start, stop = int(i * every) + 1, int((i + 1) * every) + 1
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
+
+
+## Rows of `df` to draw: rows where `keep` is True, plus an even share of the
+## rest of `budget` for each series (one per value of `by`), reduced with
+## LTTB. Every series keeps at least its first and last points, so with
+## enough series the result goes over the budget (see budget_note). PERIOD is
+## measured in contiguous months, so a year end is no wider than any other month.
+def downsample(df, x, y, by=None, budget=CHART_POINT_BUDGET, keep=None):
+    if not budget or len(df) <= budget:
+        return df
+    groups = df.groupby(by, observed=True, sort=False).indices if by else {None: np.arange(len(df))}
+    xs, ys = df[x].to_numpy(), df[y].to_numpy()
+    if x == "PERIOD":
+        xs = month_index(xs)
+    keep = np.zeros(len(df), dtype=bool) if keep is None else keep.to_numpy()
+    mask = keep.copy()
+    per_series = max((budget - int(keep.sum())) // len(groups), 2)
+    for positions in groups.values():
+        positions = positions[np.argsort(xs[positions], kind="stable")]
+        mask[positions[lttb_indices(xs[positions], ys[positions], per_series)]] = True
+    return df[mask]
+
+
+## Caption for a chart whose downsampled data is still over the budget, or
+## None when it fits
+def budget_note(df, budget=CHART_POINT_BUDGET):
+    if not budget or len(df) <= budget:
+        return None
+    return (
+        f"Drawing {len(df):,} points, more than chart_point_budget ({budget:,}), so that every series is shown. "
+        "Select fewer cities for a lighter chart."
+    )
+
+
+## Box-plot statistics per `by` group, as Vega-Lite's boxplot computes them
+## in the browser: quartiles, whiskers at the most extreme values within 1.5
+## IQR of the box, and the distinct values beyond them (at most `budget`).
+def box_stats(df, by, value, budget=CHART_POINT_BUDGET):
+    grouped = df.groupby(by, observed=True)[value]
+    boxes = pd.DataFrame({
+        "Q1": grouped.quantile(0.25),
+        "MEDIAN": grouped.median(),
+        "Q3": grouped.quantile(0.75),
+    })
+    iqr = boxes["Q3"] - boxes["Q1"]
+    rows = df[[by, value]].join(
+        pd.DataFrame({"LOW": boxes["Q1"] - 1.5 * iqr, "HIGH": boxes["Q3"] + 1.5 * iqr}), on=by
+    )
+    inside = rows[value].between(rows["LOW"], rows["HIGH"])
+    whiskers = rows[inside].groupby(by, observed=True)[value]
+    boxes["LOWER"] = whiskers.min()
+    boxes["UPPER"] = whiskers.max()
+    outliers = rows.loc[~inside & rows[value].notna(), [by, value]].drop_duplicates()
+    if budget and len(outliers) > budget:
+        outliers = outliers.sample(budget, random_state=0)
+    return boxes.reset_index(), outliers.reset_index(drop=True)
@@ -0,0 +1,23 @@
+import os
+
+import streamlit as st
+
+
+## Settings are read from DASHBOARD_<NAME> environment variables first,
+## then from the [dashboard] section of .streamlit/secrets.toml.
+def get_setting(name, default=None, cast=str):
+    value = os.environ.get(f"DASHBOARD_{name.upper()}")
+    if value is None:
+        try:
+            value = st.secrets.get("dashboard", {}).get(name)
+        except FileNotFoundError:
+            value = None
+    if value is None:
+        return default
+    return cast(value)
+
+
+def as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
@@ -0,0 +1,232 @@
+import itertools
+import logging
+import threading
+from dataclasses import dataclass, field
+
+import pandas as pd
+import streamlit as st
+
+from core.config import get_setting
+from core.periods import PERIOD_SQL, high_water_mark
+from core.pool import SessionPool
+from core.profiling import span
+from core.resultcache import RESULT_CACHE
+from core.schema import COLUMNS, arrow_to_pandas, memory_mb
+from core.snapshot import scan_snapshot
+from core.stream import plan_rows, stream_frame
+
+TABLE_NAME = "US_INCOME.PUBLIC.FINAL_CRIME_WITH_LATLON"
+
+logger = logging.getLogger(__name__)
+
+## Seconds before the cached table is reloaded; 0 keeps it until invalidated.
+DATA_TTL = get_setting("data_ttl", 3600, int) or None
+
+## "snowflake" reads the live table; "parquet" reads the local snapshot
+## written by `python -m core.snapshot` and never opens a session.
+DATA_SOURCE = get_setting("data_source", "snowflake")
+
+## "local" filters and aggregates the cached table in pandas;
+## "pushdown" sends every filter and GROUP BY to Snowflake instead.
+QUERY_MODE = get_setting("query_mode", "local") if DATA_SOURCE == "snowflake" else "local"
+
+## Snowflake sessions kept open, i.e. queries that can run at once, and the
+## idle seconds after which a session is health-checked before reuse
+SESSION_POOL_SIZE = get_setting("session_pool_size", 4, int)
+SESSION_CHECK_AFTER = get_setting("session_check_after", 300, int)
+
+
+def create_session():
+    from snowflake.snowpark import Session
+
+    return Session.builder.configs(st.secrets.snowflake).create()
+
+
+## Shared by every page and user session in the process (see core/pool.py)
+@st.cache_resource
+def session_pool():
+    return SessionPool(create_session, SESSION_POOL_SIZE, SESSION_CHECK_AFTER)
+
+
+## Runs work(session) on a pooled Snowpark session
+def run_query(work):
+    return session_pool().run(work)
+
+
+## Query results travel as Arrow record batches end to end; strings arrive as
+## categoricals rather than object arrays. Results are kept on disk by query
+## fingerprint (see core/resultcache.py) and shared with other processes.
+def fetch_arrow(sql, params=None):
+    with span("fetch", "result cache") as info:
+        table = RESULT_CACHE.get(sql, params)
+        if table is None:
+            info["label"] = "snowflake"
+            table = run_query(lambda session: session.sql(sql, params=params).to_arrow())
+            RESULT_CACHE.put(sql, params, table)
+        info.update(rows=table.num_rows, bytes=table.nbytes)
+    return table
+
+
+def fetch_frame(sql, params=None):
+    return arrow_to_pandas(fetch_arrow(sql, params))
+
+
+## Source rows after a PERIOD high-water mark (all rows when it's None)
+def _after(mark):
+    if mark is None:
+        return "", None
+    return f" WHERE YEAR >= ? AND {PERIOD_SQL} > ?", [mark // 100, mark]
+
+
+def count_source(after=None):
+    if DATA_SOURCE == "parquet":
+        return scan_snapshot(COLUMNS, after=after)[0]
+    where, params = _after(after)
+    return run_query(
+        lambda session: session.sql(f"SELECT COUNT(*) FROM {TABLE_NAME}{where}", params=params).collect()[0][0]
+    )
+
+
+## Streams `rows` of the source's `total` rows (a random sample when fewer)
+## into a compact frame sorted so core.index can answer filters with
+## contiguous row ranges. Returns the frame and the Arrow bytes streamed.
+def stream_source(rows, total, after=None, progress=False):
+    on_progress = None
+    if progress:
+        bar = st.progress(0.0, text="Loading data...")
+
+        def on_progress(fraction):
+            bar.progress(fraction, text=f"Loading data... {fraction * rows:,.0f} of {rows:,} rows")
+
+    def stream(batches, sample_from=None):
+        return stream_frame(batches, rows, sample_from, sort_by=["CITY", "YEAR", "MONTH1"], on_progress=on_progress)
+
+    if DATA_SOURCE == "parquet":
+        result = stream(scan_snapshot(COLUMNS, after=after)[1], sample_from=total)
+    else:
+        where, params = _after(after)
+        sample = f" SAMPLE ({rows} ROWS)" if rows < total else ""
+        sql = f"SELECT {', '.join(COLUMNS)} FROM {TABLE_NAME}{sample}{where}"
+        ## The session stays checked out until every batch has been read
+        result = run_query(lambda session: stream(session.sql(sql, params=params).to_arrow_batches()))
+    if progress:
+        bar.empty()
+    return result
+
+
+_VERSIONS = itertools.count(1)
+
+
+## One immutable state of the loaded table. `through` is its PERIOD
+## high-water mark and `loaded_through` the mark of the full load; rows after
+## that came from incremental syncs (see core/sync.py).
+@dataclass(frozen=True, eq=False)
+class TableVersion:
+    frame: pd.DataFrame
+    through: int = None
+    loaded_through: int = None
+    sampled: bool = False
+    version: int = field(default_factory=lambda: next(_VERSIONS))
+
+    @property
+    def synced(self):
+        return self.through != self.loaded_through
+
+
+## Holds the current TableVersion. A sync builds its successor completely and
+## swaps it in with one assignment, so readers get the old table or the new
+## one, never a half-merged frame.
+class LiveTable:
+    def __init__(self, table):
+        self.current = table
+        self.lock = threading.Lock()
+
+
+## Caches keyed on TableVersion.version keep the current and the previous
+## version, for sessions that started before a sync
+VERSION_ENTRIES = 2
+
+
+## One copy of the table per process, shared by every page and user session.
+## Rows are streamed in batches against the load budget (see core/stream.py).
+@st.cache_resource(ttl=DATA_TTL, show_spinner=False)
+def load_table():
+    from core.sync import start_refresher
+
+    with span("load", DATA_SOURCE) as info:
+        total = count_source()
+        rows = plan_rows(total)
+        df, streamed_bytes = stream_source(rows, total, progress=True)
+        info.update(rows=len(df), bytes=streamed_bytes)
+    MEMORY_REPORT.update(
+        rows=len(df), total=total, before_mb=streamed_bytes / 2**20, after_mb=memory_mb(df)
+    )
+    logger.info("Loaded %(rows)d of %(total)d rows: %(before_mb).1f MB of Arrow batches, %(after_mb).1f MB in memory", MEMORY_REPORT)
+    mark = high_water_mark(df)
+    live = LiveTable(TableVersion(df, mark, mark, sampled=rows < total))
+    start_refresher(live)
+    return live
+
+
+def current_table():
+    return load_table().current
+
+
+## The current frame. It is shared, so callers must not modify it in place.
+def load_data():
+    return current_table().frame
+
+
+## Footprint of the last load_data() call, shown under "Show table"
+MEMORY_REPORT = {}
+
+
+def describe_memory():
+    if not MEMORY_REPORT:
+        return "Table not loaded in this process."
+    text = "{rows:,} rows in memory: {after_mb:.1f} MB (streamed as {before_mb:.1f} MB of Arrow batches)"
+    if MEMORY_REPORT["rows"] < MEMORY_REPORT["total"]:
+        text += ", a random sample of {total:,} rows (over the load budget)"
+    return text.format(**MEMORY_REPORT)
+
+
+## Year/month bounds, cities and offense categories offered by the sidebar.
+def load_domain():
+    if QUERY_MODE == "pushdown":
+        return _domain(None, None)
+    table = current_table()
+    return _domain(table.version, table)
+
+
+@st.cache_resource(ttl=DATA_TTL, max_entries=VERSION_ENTRIES)
+def _domain(version, _table):
+    if _table is None:
+        bounds, cities, categories = run_query(lambda session: (
+            session.sql(f"SELECT MIN(YEAR), MAX(YEAR), MIN(MONTH1), MAX(MONTH1) FROM {TABLE_NAME}").collect()[0],
+            session.sql(f"SELECT DISTINCT CITY FROM {TABLE_NAME} ORDER BY CITY").collect(),
+            session.sql(f"SELECT DISTINCT OFFENSE_CATEGORY FROM {TABLE_NAME} ORDER BY OFFENSE_CATEGORY").collect(),
+        ))
+        return {
+            "years": (int(bounds[0]), int(bounds[1])),
+            "months": (int(bounds[2]), int(bounds[3])),
+            "cities": [row[0] for row in cities],
+            "offense_categories": [row[0] for row in categories],
+        }
+
+    df = _table.frame
+    return {
+        "years": (int(df["YEAR"].min()), int(df["YEAR"].max())),
+        "months": (int(df["MONTH1"].min()), int(df["MONTH1"].max())),
+        "cities": df["CITY"].unique().tolist(),
+        "offense_categories": df["OFFENSE_CATEGORY"].unique().tolist(),
+    }
+
+
+## Every cache derived from the table (anything with a .clear() method);
+## cleared together by invalidate_data()
+DATA_CACHES = [load_table, _domain, RESULT_CACHE]
+
+
+def invalidate_data():
+    for cache in DATA_CACHES:
+        cache.clear()
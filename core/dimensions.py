@@ -0,0 +1,43 @@
+"""ZIP x YEAR income dimension.
+
+HOUSEHOLDS, HOUSEHOLDS_MEDIAN_INCOME and the HOUSEHOLDS_* bracket shares are
+yearly facts per ZIP, but FINAL_CRIME_WITH_LATLON repeats them on every month
+and offense-category row. Aggregating them over the fact rows weights each ZIP
+by how many crime rows it has; the income dimension holds each (CITY, ZIP,
+YEAR) once, so income charts read about 12 x categories fewer rows and every
+ZIP-year counts equally.
+"""
+import streamlit as st
+
+from core.data import DATA_CACHES, DATA_TTL, TABLE_NAME, VERSION_ENTRIES, current_table
+from core.schema import INCOME_BRACKET_COLUMNS
+
+INCOME_KEYS = ["CITY", "ZIP", "YEAR"]
+INCOME_COLUMNS = [*INCOME_KEYS, "LAT", "LNG", "HOUSEHOLDS", "HOUSEHOLDS_MEDIAN_INCOME", *INCOME_BRACKET_COLUMNS]
+
+
+## Income dimension of a table version (the current one by default)
+def load_income(table=None):
+    table = table or current_table()
+    return _income(table.version, table)
+
+
+## The table is sorted by (CITY, YEAR, MONTH1), so each ZIP-year keeps the
+## values of its earliest month, as income_sql() does
+@st.cache_resource(ttl=DATA_TTL, max_entries=VERSION_ENTRIES, show_spinner=False)
+def _income(version, _table):
+    return _table.frame.drop_duplicates(INCOME_KEYS)[INCOME_COLUMNS].reset_index(drop=True)
+
+
+DATA_CACHES.append(_income)
+
+
+## The dimension as a Snowflake subquery for the filter's years and cities
+## (months and offense categories do not apply to yearly income facts)
+def income_sql(filters):
+    where, params = filters.where(("YEAR", "CITY"))
+    sql = (
+        f"SELECT {', '.join(INCOME_COLUMNS)} FROM {TABLE_NAME} WHERE {where} "
+        f"QUALIFY ROW_NUMBER() OVER (PARTITION BY {', '.join(INCOME_KEYS)} ORDER BY MONTH1) = 1"
+    )
+    return sql, params
@@ -0,0 +1,59 @@
+from dataclasses import dataclass, field
+
+from core.periods import PERIOD_PARTS
+
+
+## One groupby over the filtered rows and the chart requirements it serves
+@dataclass
+class Pass:
+    by: list
+    aggs: dict
+    members: list = field(default_factory=list)
+
+    def accepts(self, aggs):
+        return all(self.aggs.get(col, func) == func for col, func in aggs.items())
+
+    def covers(self):
+        return expand_keys(self.by)
+
+
+## Keys a result grouped by `by` can be regrouped by (YEAR and MONTH1 come from PERIOD)
+def expand_keys(by):
+    keys = set(by)
+    if "PERIOD" in keys:
+        keys.update(PERIOD_PARTS)
+    return keys
+
+
+## Plans the fewest groupbys that answer every requirement in `specs`
+## ({name: (by, aggs)}). Requirements on the same keys share one pass, and
+## sum-only requirements on a subset of another pass's keys (or of the
+## YEAR/MONTH1 parts of its PERIOD) are re-summed from that pass's much
+## smaller result instead of scanning the rows again.
+def plan_passes(specs):
+    passes = []
+    ordered = sorted(specs.items(), key=lambda item: -len(expand_keys(item[1][0])))
+    for name, (by, aggs) in ordered:
+        keys = set(by)
+        target = next((p for p in passes if set(p.by) == keys and p.accepts(aggs)), None)
+        if target is None and all(func == "sum" for func in aggs.values()):
+            target = next((p for p in passes if keys < p.covers() and p.accepts(aggs)), None)
+        if target is None:
+            target = Pass(list(by), {})
+            passes.append(target)
+        target.aggs.update(aggs)
+        target.members.append(name)
+    return passes
+
+
+## Extracts one requirement's frame from the result of the pass that served it
+def project(result, pass_by, by, aggs):
+    columns = list(by) + list(aggs)
+    if set(by) == set(pass_by):
+        if list(by) == list(pass_by):
+            return result[columns]
+        return result[columns].sort_values(list(by), ignore_index=True)
+    missing = [col for col in by if col not in result]
+    if missing:
+        result = result.assign(**{col: PERIOD_PARTS[col](result["PERIOD"]) for col in missing})
+    return result.groupby(list(by), as_index=False, observed=True)[list(aggs)].sum()[columns]
@@ -0,0 +1,67 @@
+import numpy as np
+import streamlit as st
+
+from core.data import DATA_CACHES, DATA_TTL, VERSION_ENTRIES, current_table
+
+SORT_KEYS = ["CITY", "YEAR", "MONTH1"]
+
+
+## Positions covered by the half-open ranges [starts[i], stops[i]), in order
+def expand_ranges(starts, stops):
+    lengths = stops - starts
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+## Row ranges of a table sorted by (CITY, YEAR, MONTH1), one per key, so a
+## filter state resolves to a take-list without scanning every row.
+class FilterIndex:
+    def __init__(self, df):
+        self.df = df
+        ## A range starts wherever a key differs from the row before. Rows with
+        ## a null key (integer keys holding nulls are widened to float at load)
+        ## get ranges of their own that no filter selects, so they can't shift
+        ## the ranges after them.
+        first = np.zeros(len(df), dtype=bool)
+        first[:1] = True
+        for values in (df["CITY"].cat.codes.to_numpy(), df["YEAR"].to_numpy(), df["MONTH1"].to_numpy()):
+            first[1:] |= values[1:] != values[:-1]
+        self.starts = np.flatnonzero(first)
+        self.stops = np.append(self.starts[1:], len(df))
+        self.key_city = np.asarray(df["CITY"].iloc[self.starts])
+        self.key_year = df["YEAR"].to_numpy()[self.starts]
+        self.key_month = df["MONTH1"].to_numpy()[self.starts]
+        ## The categorical codes double as the offense-category bitmap
+        self.category_codes = df["OFFENSE_CATEGORY"].cat.codes.to_numpy()
+        self.categories = {cat: code for code, cat in enumerate(df["OFFENSE_CATEGORY"].cat.categories)}
+
+    def positions(self, filters):
+        selected = (
+            np.isin(self.key_city, list(filters.cities)) &
+            (self.key_year >= filters.years[0]) & (self.key_year <= filters.years[1]) &
+            (self.key_month >= filters.months[0]) & (self.key_month <= filters.months[1])
+        )
+        positions = expand_ranges(self.starts[selected], self.stops[selected])
+        if "OFFENSE_CATEGORY" in filters.active_dims():
+            code = self.categories.get(filters.offense_category)
+            if code is None:
+                return positions[:0]
+            positions = positions[self.category_codes[positions] == code]
+        return positions
+
+    def take(self, filters):
+        return self.df.take(self.positions(filters))
+
+
+## Index of a table version (the current one by default)
+def load_index(table=None):
+    table = table or current_table()
+    return _index(table.version, table)
+
+
+@st.cache_resource(ttl=DATA_TTL, max_entries=VERSION_ENTRIES, show_spinner=False)
+def _index(version, _table):
+    return FilterIndex(_table.frame)
+
+
+DATA_CACHES.append(_index)
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+## Min-max scales `value` to [0, 1] within each `group`, using groupby's
+## built-in min/max broadcasts instead of a Python callback per group.
+## Groups whose values are all equal get `constant` instead of 0/0; missing
+## values stay missing.
+def normalize_by_group(df, group, value, constant=0.0):
+    values = df[value]
+    grouped = values.groupby(df[group], observed=True)
+    low = grouped.transform("min")
+    span = grouped.transform("max") - low
+    flat = span == 0
+    normalized = (values - low) / span.mask(flat, 1)
+    return normalized.mask(flat & values.notna(), constant)
+
+
+## Same result from NumPy segment reductions over integer group codes; useful
+## when the values are already arrays.
+def normalize_by_codes(codes, values, constant=0.0):
+    values = np.asarray(values, dtype="float64")
+    n_groups = codes.max() + 1 if len(codes) else 0
+    low = np.full(n_groups, np.inf)
+    high = np.full(n_groups, -np.inf)
+    np.fmin.at(low, codes, values)
+    np.fmax.at(high, codes, values)
+    span = (high - low)[codes]
+    flat = span == 0
+    normalized = (values - low[codes]) / np.where(flat, 1, span)
+    normalized[flat & ~np.isnan(values)] = constant
+    return normalized
+
+
+## {value: rows} for a frame already sorted by `column`, as positional slices
+## (views) of `df` rather than one boolean scan per value
+def group_slices(df, column):
+    values = df[column].to_numpy()
+    if len(values) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    stops = np.r_[starts[1:], len(values)]
+    return {values[start]: df.iloc[start:stop] for start, stop in zip(starts, stops)}
@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import get_setting
+from core.data import DATA_CACHES, DATA_TTL
+from core.resultcache import RESULT_CACHE
+
+AGGREGATE_CACHE_SIZE = get_setting("aggregate_cache_size", 256, int)
+DECK_CACHE_SIZE = get_setting("deck_cache_size", 64, int)
+
+
+## Thread-safe LRU map shared by every session in the process. Entries older
+## than `ttl` seconds count as misses, so they never outlive the data they
+## were computed from.
+class LRUCache:
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and (self.ttl is None or time.monotonic() - item[0] < self.ttl):
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+AGGREGATE_CACHE = LRUCache(AGGREGATE_CACHE_SIZE, DATA_TTL)
+DATA_CACHES.append(AGGREGATE_CACHE)
+
+## Built pydeck maps, keyed on (city, filter state, binning mode)
+DECK_CACHE = LRUCache(DECK_CACHE_SIZE, DATA_TTL)
+DATA_CACHES.append(DECK_CACHE)
+
+
+def describe_cache():
+    stats = AGGREGATE_CACHE.stats()
+    total = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / total if total else 0
+    text = (
+        "Aggregate cache: {size}/{maxsize} entries, {hits} hits, {misses} misses".format(**stats)
+        + f" ({rate:.0%} hit rate)"
+    )
+    disk = RESULT_CACHE.stats()
+    if disk["hits"] or disk["misses"]:
+        text += "; query result cache: {files} files, {mb:.1f} MB, {hits} hits, {misses} misses".format(**disk)
+    return text
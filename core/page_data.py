@@ -0,0 +1,132 @@
+"""Data behind each page's charts, as functions of the page's DataQuery.
+
+The pages draw their charts from these frames and benchmarks/pages.py times
+the same functions, so a change to what a page requests or how it reshapes
+the results shows up in the benchmark.
+"""
+import pandas as pd
+
+from core.charts import box_stats, downsample
+from core.kernels import group_slices, normalize_by_group
+from core.periods import period_key
+from core.schema import INCOME_BRACKET_COLUMNS
+
+CITY_SUMMARY_SPEC = (["CITY"], {"TOTAL_CRIMES": "sum", "HOUSEHOLDS_MEDIAN_INCOME": "median", "HOUSEHOLDS": "mean"})
+
+## Axis labels of the income brackets, in bracket order
+INCOME_BRACKET_LABELS = dict(zip(INCOME_BRACKET_COLUMNS, [
+    "<10K", "10K-15K", "15K-25K", "25K-35K", "35K-50K", "50K-75K", "75K-100K", "100K-150K", "150K-200K", "200K+",
+]))
+
+
+## Key Insights: crime vs income per city, and the crime rate per household
+def insights_city_data(query):
+    crime_income_data = query.aggregate(*CITY_SUMMARY_SPEC)
+    crime_rate = crime_income_data["TOTAL_CRIMES"] / crime_income_data["HOUSEHOLDS"]
+    ## Only the columns the chart encodes are sent to the browser
+    crime_rate_data = crime_income_data.assign(CRIME_RATE_PER_HOUSEHOLD=crime_rate)[
+        ["CITY", "CRIME_RATE_PER_HOUSEHOLD", "HOUSEHOLDS_MEDIAN_INCOME"]
+    ]
+    return crime_income_data, crime_rate_data
+
+
+## Key Insights: normalized monthly crime per city, with a dot in the month
+## each city's median income changed
+def insights_trend_data(query):
+    chart_data = query.aggregate_many({
+        "crime_trend": (["CITY", "PERIOD"], {"TOTAL_CRIMES": "sum"}),
+        "income_trend": (["CITY", "YEAR"], {"HOUSEHOLDS_MEDIAN_INCOME": "median"}),
+    })
+
+    crime_trend = chart_data["crime_trend"]
+
+    income_trend = chart_data["income_trend"]
+
+    income_trend["PERIOD"] = period_key(income_trend["YEAR"], 1)  # Month 01 for yearly data
+
+    income_trend["HOUSEHOLDS_MEDIAN_INCOME_NORM"] = normalize_by_group(income_trend, "CITY", "HOUSEHOLDS_MEDIAN_INCOME")
+
+    income_trend["INCOME_CHANGE"] = income_trend.groupby("CITY", observed=True)["HOUSEHOLDS_MEDIAN_INCOME"].diff().fillna(0)
+    income_filtered = income_trend[income_trend["INCOME_CHANGE"] != 0].copy()
+
+    city_monthly_trend = crime_trend.merge(
+        income_filtered[["CITY", "PERIOD", "HOUSEHOLDS_MEDIAN_INCOME", "HOUSEHOLDS_MEDIAN_INCOME_NORM"]],
+        on=["CITY", "PERIOD"],
+        how="left"
+    )
+    city_monthly_trend["TOTAL_CRIMES_NORM"] = normalize_by_group(city_monthly_trend, "CITY", "TOTAL_CRIMES")
+
+    ## Crime lines within the point budget; every income dot is kept
+    return downsample(
+        city_monthly_trend, "PERIOD", "TOTAL_CRIMES_NORM", by="CITY",
+        keep=city_monthly_trend["HOUSEHOLDS_MEDIAN_INCOME_NORM"].notna(),
+    )
+
+
+## Crime: monthly trend per city and the normalized month x city heat map,
+## from one pass over the rows
+def crime_time_data(query):
+    chart_data = query.aggregate_many({
+        "trend": (["PERIOD", "CITY"], {"TOTAL_CRIMES": "sum"}),
+        "by_month": (["MONTH1", "CITY"], {"TOTAL_CRIMES": "sum"}),
+    })
+    trend = downsample(chart_data["trend"], "PERIOD", "TOTAL_CRIMES", by="CITY")
+    by_month = chart_data["by_month"]
+    by_month["NORMALIZED_CRIMES"] = normalize_by_group(by_month, "CITY", "TOTAL_CRIMES")  # Normalize per city
+    return trend, by_month
+
+
+## Crime: totals per city and offense category, long and as a table
+def crime_category_data(query):
+    crime_by_city = query.aggregate(["CITY", "OFFENSE_CATEGORY"], {"TOTAL_CRIMES": "sum"})
+    table = crime_by_city.pivot_table(
+        values="TOTAL_CRIMES",
+        index="OFFENSE_CATEGORY",
+        columns="CITY",
+        aggfunc="sum",
+        fill_value=0,
+        observed=True
+    )
+    return crime_by_city, table
+
+
+## Income facts are yearly per ZIP, so the Income page's data comes from the
+## ZIP x YEAR income dimension (query.income, see core/dimensions.py) rather
+## than the month x offense-category fact rows.
+
+## Income: mean income and households per city, and the share of households
+## in each bracket, from one pass over the ZIP-years
+def income_city_data(query):
+    chart_data = query.income.aggregate_many({
+        "city_summary": (["CITY"], {"HOUSEHOLDS_MEDIAN_INCOME": "mean", "HOUSEHOLDS": "mean"}),
+        "brackets": (["CITY"], {col: "mean" for col in INCOME_BRACKET_COLUMNS}),
+    })
+    brackets = chart_data["brackets"].rename(columns=INCOME_BRACKET_LABELS)
+    brackets = brackets.melt(id_vars=["CITY"], var_name="Income Bracket", value_name="Percentage")
+    brackets["Percentage"] /= 100
+    brackets["Income Bracket"] = pd.Categorical(
+        brackets["Income Bracket"], categories=list(INCOME_BRACKET_LABELS.values()), ordered=True
+    )
+    return chart_data["city_summary"], brackets
+
+
+## Income: box-plot statistics per city. Quartiles, whiskers and outliers are
+## computed here, so the browser gets a few rows per city instead of every
+## ZIP-year (see core/charts.py)
+def income_box_data(query):
+    return box_stats(query.income.rows(["CITY", "HOUSEHOLDS_MEDIAN_INCOME"]), "CITY", "HOUSEHOLDS_MEDIAN_INCOME")
+
+
+## Income: yearly median income per city
+def income_trend_data(query):
+    trend = query.income.aggregate(["YEAR", "CITY"], {"HOUSEHOLDS_MEDIAN_INCOME": "median"})
+    return downsample(trend, "YEAR", "HOUSEHOLDS_MEDIAN_INCOME", by="CITY")
+
+
+## Heatmaps: crime totals and mean income per ZIP for every selected city in
+## one pass, sliced per city
+def heatmap_data(query):
+    map_data = query.aggregate(
+        ["CITY", "ZIP", "LAT", "LNG"], {"TOTAL_CRIMES": "sum", "HOUSEHOLDS_MEDIAN_INCOME": "mean"}
+    )
+    return group_slices(map_data, "CITY")
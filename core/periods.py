@@ -0,0 +1,38 @@
+"""Time dimension: an integer YEAR * 100 + MONTH1 period key.
+
+The table carries it as a PERIOD column computed once at load, so trend charts
+group, merge and sort on one int32 instead of building "YYYY-MM" strings. The
+label is produced by Vega in the browser, only for the values a chart draws.
+"""
+
+## SQL for the same key, for pushdown queries and Snowflake rollups
+PERIOD_SQL = "YEAR * 100 + MONTH1"
+
+## Vega expression giving the "YYYY-MM" label of datum.PERIOD
+PERIOD_LABEL_EXPR = "floor(datum.PERIOD / 100) + '-' + slice('0' + (datum.PERIOD % 100), -2)"
+
+## Columns that can be recovered from PERIOD, with how to do it
+PERIOD_PARTS = {
+    "YEAR": lambda period: period // 100,
+    "MONTH1": lambda period: period % 100,
+}
+
+
+## Integer month key, e.g. 2019 and 3 -> 201903. YEAR is widened first because
+## int16 can't hold YEAR * 100.
+def period_key(year, month):
+    return year.astype("int32") * 100 + month
+
+
+## Months since year 0 for PERIOD keys, so consecutive months are one apart
+## even across a year end (201912 -> 202001 is a jump of 89 in PERIOD)
+def month_index(period):
+    return (period // 100) * 12 + period % 100
+
+
+## Latest PERIOD in a frame, or None when it has no rows. Source rows only
+## ever arrive for later periods, so this marks how far a load has read.
+def high_water_mark(df):
+    if df.empty:
+        return None
+    return int(df["PERIOD"].max())
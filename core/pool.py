@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+## A bounded pool of Snowpark sessions shared by every user session in the
+## process. At most `size` queries run at once; an idle session is checked
+## with SELECT 1 before reuse once it has sat for `check_after` seconds, and a
+## query that fails on a dead session (e.g. an expired login token) is retried
+## once on a fresh one.
+class SessionPool:
+    def __init__(self, factory, size, check_after=300):
+        self.factory = factory
+        self.size = size
+        self.check_after = check_after
+        self.created = 0
+        self.reconnects = 0
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _healthy(self, session):
+        try:
+            session.sql("SELECT 1").collect()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, session):
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def _connect(self):
+        session = self.factory()
+        with self._lock:
+            self.created += 1
+        return session
+
+    def _checkout(self):
+        with self._lock:
+            idle = self._idle.pop() if self._idle else None
+        if idle is None:
+            return self._connect()
+        session, since = idle
+        if time.monotonic() - since >= self.check_after and not self._healthy(session):
+            logger.info("Replacing an idle Snowflake session that failed its health check")
+            self._discard(session)
+            with self._lock:
+                self.reconnects += 1
+            return self._connect()
+        return session
+
+    def _checkin(self, session):
+        with self._lock:
+            self._idle.append((session, time.monotonic()))
+
+    ## Runs work(session) on a pooled session and returns its result
+    def run(self, work):
+        with self._slots:
+            session = self._checkout()
+            try:
+                result = work(session)
+            except Exception:
+                if self._healthy(session):
+                    self._checkin(session)
+                    raise
+                logger.info("Reconnecting after a query failed on a dead Snowflake session")
+                self._discard(session)
+                with self._lock:
+                    self.reconnects += 1
+                session = self._connect()
+                try:
+                    result = work(session)
+                except Exception:
+                    self._checkin(session)
+                    raise
+            self._checkin(session)
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "created": self.created, "reconnects": self.reconnects}
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session, _ in idle:
+            self._discard(session)
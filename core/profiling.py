@@ -0,0 +1,232 @@
+"""Timing of each page rerun, broken down into the steps on its hot path.
+
+A page calls start_rerun() at the top and profile_panel() at the bottom. In
+between, span() records how long one step took: the table load, a Snowflake
+fetch, the filter, each aggregation, each chart build and each render, with
+the rows it produced and, while the panel is shown, the bytes each render
+sends to the browser. Spans opened on the chart and query threads are
+attached to the rerun that submitted the work (see
+core/render.in_script_context).
+
+Finished reruns are kept per page for the last profile_window reruns, which
+give the p50/p95 latencies in the "Profiling" sidebar panel. They can also be
+appended as JSON lines to profile_log, and the latencies written in the
+Prometheus text format to profile_metrics_file (for a node_exporter textfile
+collector, say) after every rerun.
+"""
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+import streamlit as st
+
+from core.config import as_bool, get_setting
+
+PROFILING = get_setting("profiling", True, as_bool)
+PROFILE_WINDOW = get_setting("profile_window", 500, int)
+PROFILE_LOG = get_setting("profile_log", "")
+PROFILE_METRICS_FILE = get_setting("profile_metrics_file", "")
+
+QUANTILES = (0.5, 0.95)
+## session_state key of the "Show profiling" checkbox
+PANEL_KEY = "show_profiling"
+
+_CURRENT = ContextVar("rerun", default=None)
+
+
+## Spans of one page rerun; spans may be added from several threads
+class Rerun:
+    def __init__(self, page):
+        self.page = page
+        self.started = time.time()
+        self.seconds = None
+        self.spans = []
+        self._clock = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, start, seconds, label=None, rows=None, bytes=None):
+        with self._lock:
+            self.spans.append({
+                "span": name,
+                "label": label,
+                "start": start - self._clock,
+                "seconds": seconds,
+                "rows": rows,
+                "bytes": bytes,
+            })
+
+    def finish(self):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self._clock
+        return self
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {"page": self.page, "time": self.started, "seconds": self.seconds, "spans": spans}
+
+
+def current_rerun():
+    return _CURRENT.get()
+
+
+## Measuring a chart's payload serializes it a second time, so renders only do
+## it while the "Profiling" panel is shown
+def measuring_payloads():
+    return _CURRENT.get() is not None and st.session_state.get(PANEL_KEY, False)
+
+
+## Starts timing a rerun of `page` on the script thread
+def start_rerun(page):
+    rerun = Rerun(page) if PROFILING else None
+    _CURRENT.set(rerun)
+    return rerun
+
+
+## Runs the body with `rerun` as the current one, e.g. on a pool thread
+@contextmanager
+def attached(rerun):
+    token = _CURRENT.set(rerun)
+    try:
+        yield
+    finally:
+        _CURRENT.reset(token)
+
+
+## Times the body as step `name` of the current rerun. The body may fill in
+## "label", "rows" and "bytes" on the dict it is given.
+@contextmanager
+def span(name, label=None):
+    rerun = _CURRENT.get()
+    info = {"label": label}
+    if rerun is None:
+        yield info
+        return
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        rerun.add(name, start, time.perf_counter() - start, **info)
+
+
+## Finished reruns and latency windows per page, for every session in the process
+class RerunStats:
+    def __init__(self, window):
+        self.recent = deque(maxlen=window)
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._totals = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+
+    def record(self, rerun):
+        series = [((rerun.page, None), rerun.seconds)]
+        series += [((rerun.page, span["span"]), span["seconds"]) for span in rerun.spans]
+        with self._lock:
+            self.recent.append(rerun)
+            for key, seconds in series:
+                self._latencies[key].append(seconds)
+                self._totals[key][0] += 1
+                self._totals[key][1] += seconds
+
+    ## {(page, span): {"count", "sum", 0.5, 0.95}}; span None is the whole rerun
+    def summary(self):
+        with self._lock:
+            windows = {key: sorted(values) for key, values in self._latencies.items()}
+            totals = {key: tuple(total) for key, total in self._totals.items()}
+        summary = {}
+        for key, values in sorted(windows.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+            summary[key] = {"count": totals[key][0], "sum": totals[key][1]}
+            for q in QUANTILES:
+                summary[key][q] = values[min(math.ceil(q * len(values)) - 1, len(values) - 1)]
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self.recent.clear()
+            self._latencies.clear()
+            self._totals.clear()
+
+
+RERUN_STATS = RerunStats(PROFILE_WINDOW)
+
+_LOG_LOCK = threading.Lock()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+## Rerun and per-step latencies as Prometheus summaries
+def prometheus_metrics():
+    lines = []
+    metrics = [
+        ("dashboard_rerun_seconds", "Wall time of a page rerun.", False),
+        ("dashboard_span_seconds", "Wall time of one step of a page rerun.", True),
+    ]
+    summary = RERUN_STATS.summary()
+    for metric, help_text, spans in metrics:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} summary"]
+        for (page, name), stats in summary.items():
+            if (name is not None) != spans:
+                continue
+            labels = f'page="{_label(page)}"' + (f',span="{_label(name)}"' if spans else "")
+            for q in QUANTILES:
+                lines.append(f'{metric}{{{labels},quantile="{q}"}} {stats[q]:.6f}')
+            lines.append(f"{metric}_sum{{{labels}}} {stats['sum']:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {stats['count']}")
+    return "\n".join(lines) + "\n"
+
+
+## The recent reruns of every page, one JSON object per line
+def json_lines(reruns=None):
+    reruns = list(RERUN_STATS.recent) if reruns is None else reruns
+    return "".join(json.dumps(rerun.to_dict()) + "\n" for rerun in reruns)
+
+
+def _export(rerun):
+    if PROFILE_LOG:
+        with _LOG_LOCK, open(PROFILE_LOG, "a") as log:
+            log.write(json_lines([rerun]))
+    if PROFILE_METRICS_FILE:
+        partial = f"{PROFILE_METRICS_FILE}.{uuid.uuid4().hex}.tmp"
+        with open(partial, "w") as metrics:
+            metrics.write(prometheus_metrics())
+        os.replace(partial, PROFILE_METRICS_FILE)
+
+
+## Ends the current rerun, records and exports it, and shows the optional
+## "Profiling" panel in the sidebar
+def profile_panel():
+    rerun = _CURRENT.get()
+    if rerun is None:
+        return
+    _CURRENT.set(None)
+    RERUN_STATS.record(rerun.finish())
+    _export(rerun)
+
+    if not st.sidebar.checkbox("Show profiling", key=PANEL_KEY):
+        return
+    with st.sidebar.expander("Profiling", expanded=True):
+        st.caption(f"This rerun: {rerun.seconds * 1000:,.0f} ms")
+        spans = pd.DataFrame(rerun.to_dict()["spans"], columns=["span", "label", "start", "seconds", "rows", "bytes"])
+        spans["start"] = (spans["start"] * 1000).round(1)
+        spans["seconds"] = (spans["seconds"] * 1000).round(1)
+        st.dataframe(spans.rename(columns={"start": "start ms", "seconds": "ms"}), hide_index=True)
+
+        summary = RERUN_STATS.summary()
+        latencies = pd.DataFrame([
+            {"page": page, "span": name or "rerun", "count": stats["count"],
+             "p50 ms": stats[0.5] * 1000, "p95 ms": stats[0.95] * 1000}
+            for (page, name), stats in summary.items()
+        ])
+        st.caption(f"Latency over the last {PROFILE_WINDOW} reruns of each page")
+        st.dataframe(latencies.round(1), hide_index=True)
+
+        st.download_button("Reruns (JSON lines)", json_lines(), "reruns.jsonl", "application/x-ndjson")
+        st.download_button("Metrics (Prometheus)", prometheus_metrics(), "metrics.prom", "text/plain")
@@ -0,0 +1,233 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+
+from core.config import get_setting
+from core.data import QUERY_MODE, SESSION_POOL_SIZE, TABLE_NAME, current_table, fetch_frame
+from core.dimensions import income_sql, load_income
+from core.engine import plan_passes, project
+from core.index import load_index
+from core.memo import AGGREGATE_CACHE
+from core.profiling import span
+from core.render import in_script_context
+from core.rollups import find_rollup
+from core.schema import DERIVED_SQL
+
+ALL_CATEGORIES = "All Categories"
+
+## Pushdown queries from one aggregate_many() call run side by side on these
+## threads (each on its own pooled session), so a page waits for its slowest
+## query rather than the sum of them
+QUERY_WORKERS = get_setting("query_workers", SESSION_POOL_SIZE, int)
+QUERY_EXECUTOR = ThreadPoolExecutor(QUERY_WORKERS, thread_name_prefix="query")
+
+## Aggregations the pages use, with their Snowflake equivalents
+SQL_AGGREGATES = {"sum": "SUM", "mean": "AVG", "median": "MEDIAN", "min": "MIN", "max": "MAX"}
+
+
+@dataclass(frozen=True)
+class Filters:
+    years: tuple
+    months: tuple
+    cities: tuple
+    offense_category: str = ALL_CATEGORIES
+
+    ## Canonical, hashable form: city order doesn't change any result
+    def key(self):
+        return (tuple(self.years), tuple(self.months), tuple(sorted(self.cities)), self.offense_category)
+
+    ## Parameterized WHERE clause and its bind values, constraining only
+    ## `columns` (by default every filter dimension)
+    def where(self, columns=("YEAR", "MONTH1", "CITY", "OFFENSE_CATEGORY")):
+        clauses, params = [], []
+        if "YEAR" in columns:
+            clauses.append("YEAR BETWEEN ? AND ?")
+            params.extend([int(self.years[0]), int(self.years[1])])
+        if "MONTH1" in columns:
+            clauses.append("MONTH1 BETWEEN ? AND ?")
+            params.extend([int(self.months[0]), int(self.months[1])])
+        if "CITY" in columns:
+            if self.cities:
+                clauses.append(f"CITY IN ({', '.join('?' for _ in self.cities)})")
+                params.extend(self.cities)
+            else:
+                clauses.append("1 = 0")
+        if "OFFENSE_CATEGORY" in columns and self.offense_category != ALL_CATEGORIES:
+            clauses.append("OFFENSE_CATEGORY = ?")
+            params.append(self.offense_category)
+        return " AND ".join(clauses), params
+
+    ## Columns this filter state actually constrains
+    def active_dims(self):
+        dims = ["YEAR", "MONTH1", "CITY"]
+        if self.offense_category != ALL_CATEGORIES:
+            dims.append("OFFENSE_CATEGORY")
+        return dims
+
+    ## Same selection as a boolean mask over a pandas frame. Columns the frame
+    ## doesn't carry (e.g. MONTH1 in a yearly rollup) are skipped.
+    def mask(self, df):
+        mask = pd.Series(True, index=df.index)
+        if "YEAR" in df:
+            mask &= df["YEAR"].between(self.years[0], self.years[1])
+        if "MONTH1" in df:
+            mask &= df["MONTH1"].between(self.months[0], self.months[1])
+        if "CITY" in df:
+            mask &= df["CITY"].isin(self.cities)
+        if "OFFENSE_CATEGORY" in df and self.offense_category != ALL_CATEGORIES:
+            mask &= df["OFFENSE_CATEGORY"] == self.offense_category
+        return mask
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _select_column(column):
+    if column in DERIVED_SQL:
+        return f"{DERIVED_SQL[column]} AS {_quote(column)}"
+    return _quote(column)
+
+
+## FROM clause (with the filter applied) and its bind values, for the fact
+## table or a dimension
+def _source(filters, dimension=None):
+    if dimension == "income":
+        sql, params = income_sql(filters)
+        return f"({sql}) AS INCOME", params
+    where, params = filters.where()
+    return f"{TABLE_NAME} WHERE {where}", params
+
+
+def build_aggregate_sql(filters, by, aggs, dimension=None):
+    source, params = _source(filters, dimension)
+    group_cols = ", ".join(_quote(col) for col in by)
+    measures = ", ".join(
+        f"{SQL_AGGREGATES[func]}({_quote(col)}) AS {_quote(col)}" for col, func in aggs.items()
+    )
+    select_cols = ", ".join(_select_column(col) for col in by)
+    sql = (
+        f"SELECT {select_cols}, {measures} FROM {source} "
+        f"GROUP BY {group_cols} ORDER BY {group_cols}"
+    )
+    return sql, params
+
+
+def build_rows_sql(filters, columns=None, limit=None, dimension=None):
+    source, params = _source(filters, dimension)
+    selected = ", ".join(_select_column(col) for col in columns) if columns else "*"
+    sql = f"SELECT {selected} FROM {source}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+
+## Answers one page's data requests for a given filter state, either from the
+## cached table (local mode) or with small queries against Snowflake (pushdown).
+## With dimension="income" the requests run over the ZIP x YEAR income
+## dimension instead of the fact rows (see core/dimensions.py).
+##
+## A page's chart builders share one DataQuery from several threads, so the
+## table version is resolved when the query is created and the filtered frame
+## is computed once under the query's own lock.
+class DataQuery:
+    def __init__(self, filters, mode=QUERY_MODE, dimension=None, table=None):
+        self.filters = filters
+        self.mode = mode
+        self.dimension = dimension
+        ## The table version this query reads, fixed for its lifetime so a
+        ## background sync can't change it between two charts (None in pushdown)
+        self.table = table or (current_table() if mode == "local" else None)
+        ## The same filter state over the income dimension, on the same table version
+        self.income = DataQuery(filters, mode, "income", self.table) if dimension is None else None
+        self._frame = None
+        self._frame_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.table.version if self.table is not None else None
+
+    @property
+    def frame(self):
+        with self._frame_lock:
+            if self._frame is None:
+                self._frame = self._filter()
+        return self._frame
+
+    def _filter(self):
+        with span("filter", self.dimension) as info:
+            if self.dimension == "income":
+                income = load_income(self.table)
+                frame = income[self.filters.mask(income)]
+            else:
+                frame = load_index(self.table).take(self.filters)
+            info["rows"] = len(frame)
+        return frame
+
+    def _cache_key(self, by, aggs):
+        return (self.mode, self.version, self.dimension, self.filters.key(), tuple(by), tuple(aggs.items()))
+
+    ## Each rollup answers queries over the fact rows or over one dimension
+    def _rollup(self, by, aggs):
+        return find_rollup(by, aggs, self.filters, self.table, self.dimension)
+
+    ## Results are memoized per (filter state, grouping, measures) across all
+    ## sessions; callers get a copy they are free to modify.
+    def aggregate(self, by, aggs):
+        key = self._cache_key(by, aggs)
+        result = AGGREGATE_CACHE.get(key)
+        if result is None:
+            result = self._aggregate(by, aggs)
+            AGGREGATE_CACHE.put(key, result)
+        return result.copy()
+
+    ## Several chart requirements ({name: (by, aggs)}) answered together in the
+    ## fewest passes over the filtered rows (see core.engine.plan_passes).
+    def aggregate_many(self, specs):
+        results = {}
+        pending = {}
+        for name, (by, aggs) in specs.items():
+            cached = AGGREGATE_CACHE.get(self._cache_key(by, aggs))
+            if cached is not None:
+                results[name] = cached
+            elif self._rollup(by, aggs)[0] is not None:
+                results[name] = self._aggregate(by, aggs)
+                AGGREGATE_CACHE.put(self._cache_key(by, aggs), results[name])
+            else:
+                pending[name] = (by, aggs)
+
+        plans = plan_passes(pending)
+        if self.mode == "pushdown" and len(plans) > 1:
+            passes = QUERY_EXECUTOR.map(in_script_context(lambda plan: self._aggregate(plan.by, plan.aggs)), plans)
+        else:
+            passes = (self._aggregate(plan.by, plan.aggs) for plan in plans)
+        for plan, result in zip(plans, passes):
+            for name in plan.members:
+                by, aggs = pending[name]
+                results[name] = project(result, plan.by, by, aggs)
+                AGGREGATE_CACHE.put(self._cache_key(by, aggs), results[name])
+        return {name: result.copy() for name, result in results.items()}
+
+    def _aggregate(self, by, aggs):
+        with span("aggregate", ",".join(by)) as info:
+            result = self._compute(by, aggs)
+            info["rows"] = len(result)
+        return result
+
+    def _compute(self, by, aggs):
+        rollup, cube = self._rollup(by, aggs)
+        if rollup is not None:
+            return rollup.aggregate(cube, by, aggs, self.filters)
+        if self.mode == "pushdown":
+            sql, params = build_aggregate_sql(self.filters, by, aggs, self.dimension)
+            return fetch_frame(sql, params)
+        return self.frame.groupby(by, as_index=False, observed=True).agg(aggs)
+
+    def rows(self, columns=None, limit=None):
+        if self.mode == "pushdown":
+            sql, params = build_rows_sql(self.filters, columns, limit, self.dimension)
+            return fetch_frame(sql, params)
+        rows = self.frame if columns is None else self.frame[columns]
+        return rows if limit is None else rows.head(limit)
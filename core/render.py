@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from core.config import get_setting
+from core.profiling import attached, current_rerun, measuring_payloads, span
+
+## Chart builders from every session share these threads
+CHART_WORKERS = get_setting("chart_workers", 4, int)
+CHART_EXECUTOR = ThreadPoolExecutor(CHART_WORKERS, thread_name_prefix="chart")
+
+
+## `work` wrapped to run on a pool thread under the calling script's context,
+## so the cached loaders it reaches behave as they do on the script thread and
+## its profiling spans land in the calling rerun
+def in_script_context(work):
+    ctx = get_script_run_ctx(suppress_warning=True)
+    rerun = current_rerun()
+
+    def run(*args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        with attached(rerun):
+            return work(*args)
+
+    return run
+
+
+## A chart drawn with a caption under it (no caption when it's None)
+@dataclass(frozen=True)
+class Captioned:
+    chart: object
+    caption: str = None
+
+
+## Approximate bytes a chart sends to the browser
+def payload_bytes(chart):
+    if isinstance(chart, pd.DataFrame):
+        return int(chart.memory_usage(deep=True).sum())
+    return len(chart.to_json())
+
+
+def draw(slot, chart, label=None):
+    caption = None
+    if isinstance(chart, Captioned):
+        chart, caption = chart.chart, chart.caption
+    with span("render", label) as info:
+        target = slot.container() if caption else slot
+        if isinstance(chart, pd.DataFrame):
+            info["rows"] = len(chart)
+            target.dataframe(chart)
+        else:
+            target.altair_chart(chart, use_container_width=True)
+        if caption:
+            target.caption(caption)
+        if measuring_payloads():
+            info["bytes"] = payload_bytes(chart)
+
+
+def _timed(build):
+    def run():
+        with span("build", build.__name__):
+            return build()
+
+    return run
+
+
+## Runs every (placeholders, builder) job on the chart threads at once and
+## draws a builder's charts (one per placeholder, in order) as soon as it
+## returns, so the cheapest chart shows first. Placeholders show a spinner
+## until then. Builders must not call Streamlit themselves; a chart that
+## needs a note under it is returned as Captioned.
+def render_charts(jobs, text="Computing chart..."):
+    spinners = {}
+    futures = {}
+    try:
+        for slots, build in jobs:
+            for slot in slots:
+                spinners[slot] = slot.spinner(text)
+                spinners[slot].__enter__()
+            futures[CHART_EXECUTOR.submit(in_script_context(_timed(build)))] = (slots, build.__name__)
+        for future in as_completed(futures):
+            slots, name = futures[future]
+            charts = future.result()
+            if len(slots) == 1:
+                charts = (charts,)
+            for i, (slot, chart) in enumerate(zip(slots, charts)):
+                spinners.pop(slot).__exit__(None, None, None)
+                draw(slot, chart, f"{name}[{i}]")
+    finally:
+        for spinner in spinners.values():
+            spinner.__exit__(None, None, None)
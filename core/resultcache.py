@@ -0,0 +1,139 @@
+"""On-disk cache of Snowflake query results, shared by every process on a host.
+
+Each result is a Parquet file named after a fingerprint of the normalized SQL
+text and its bind parameters, so the same aggregate issued by another worker,
+or after a restart, is read from disk instead of being run again. Files are
+written to a temporary name and renamed into place, which keeps concurrent
+writers from exposing partial files. A file's mtime is when it was written
+(for query_cache_ttl) and its atime when it was last read (for LRU eviction
+once the directory exceeds query_cache_mb).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import pyarrow.parquet as pq
+
+from core.config import get_setting
+
+QUERY_CACHE_DIR = get_setting("query_cache_dir", os.path.join("data", "query_cache"))
+## 0 turns the cache off
+QUERY_CACHE_MB = get_setting("query_cache_mb", 256, float)
+QUERY_CACHE_TTL = get_setting("query_cache_ttl", 3600, int)
+
+## Quoted string literals, which normalization leaves untouched
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+## SQL with runs of whitespace outside string literals collapsed to one space
+def normalize_sql(sql):
+    parts = _LITERAL.split(sql.strip())
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+
+
+def fingerprint(sql, params=None):
+    text = json.dumps([normalize_sql(sql), list(params or [])], default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path, max_mb, ttl=None):
+        self.path = path
+        self.max_bytes = max_mb * 2**20
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _file(self, sql, params):
+        return os.path.join(self.path, f"{fingerprint(sql, params)}.parquet")
+
+    def get(self, sql, params=None):
+        if not self.enabled:
+            return None
+        path = self._file(sql, params)
+        try:
+            written = os.stat(path).st_mtime
+            if self.ttl and time.time() - written >= self.ttl:
+                raise FileNotFoundError(path)
+            table = pq.read_table(path, memory_map=True)
+            os.utime(path, (time.time(), written))
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return table
+
+    def put(self, sql, params, table):
+        if not self.enabled:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(sql, params)
+        partial = f"{path}.{uuid.uuid4().hex}.tmp"
+        pq.write_table(table, partial, compression="zstd")
+        os.replace(partial, path)
+        self._evict()
+
+    ## Drops expired files, then the least recently read ones until the
+    ## directory fits in max_bytes. Other processes may be evicting too.
+    def _evict(self):
+        now = time.time()
+        entries = []
+        with os.scandir(self.path) as files:
+            for entry in files:
+                if not entry.name.endswith(".parquet"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, _, size, _ in entries)
+        for read, written, size, path in entries:
+            expired = self.ttl and now - written >= self.ttl
+            if not expired and total <= self.max_bytes:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(".parquet"):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        files, size = 0, 0
+        if os.path.isdir(self.path):
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".parquet"):
+                        continue
+                    try:
+                        size += entry.stat().st_size
+                    except FileNotFoundError:
+                        continue
+                    files += 1
+        with self._lock:
+            return {"files": files, "mb": size / 2**20, "hits": self.hits, "misses": self.misses}
+
+
+RESULT_CACHE = ResultCache(QUERY_CACHE_DIR, QUERY_CACHE_MB, QUERY_CACHE_TTL)
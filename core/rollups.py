@@ -0,0 +1,247 @@
+"""Pre-aggregated rollup tables ("cubes") for the dashboard's filter dimensions.
+
+Build them once with
+
+    python -m core.rollups --target parquet      # files under rollup_dir
+    python -m core.rollups --target snowflake    # ROLLUP_* tables next to the source table
+
+and set ``rollups = "parquet"`` (or ``"snowflake"``) so DataQuery answers the
+charts it can from these small tables instead of the raw zip-month rows.
+Each cube records the PERIOD high-water mark of the rows it was built from,
+so rows loaded or synced after the build are added to it (or, when it can't
+be, the cube is not used) rather than silently left out.
+"""
+import argparse
+import logging
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+import streamlit as st
+
+from core.config import get_setting
+from core.data import (
+    DATA_CACHES, DATA_TTL, TABLE_NAME, VERSION_ENTRIES, create_session, fetch_frame, load_data, run_query,
+)
+from core.periods import PERIOD_SQL, high_water_mark
+from core.schema import DERIVED_SQL
+
+ROLLUP_SOURCE = get_setting("rollups", "off")
+ROLLUP_DIR = get_setting("rollup_dir", os.path.join("data", "rollups"))
+ROLLUP_SCHEMA = TABLE_NAME.rsplit(".", 1)[0]
+## Column holding the PERIOD high-water mark of a cube's source rows
+MARK_COLUMN = "SOURCE_THROUGH"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    dims: tuple
+    sums: tuple = ()
+    ## Means are stored as <COL>_SUM and <COL>_COUNT so they re-aggregate exactly
+    means: tuple = ()
+    ## Medians can't be re-aggregated, so they only answer queries at exactly `dims`
+    medians: tuple = ()
+    ## Filter dimensions the measures don't vary by
+    invariant: tuple = ()
+    ## Rows are deduplicated on these columns before aggregating
+    distinct_on: tuple = ()
+    ## The DataQuery dimension this cube answers (None for the fact rows)
+    dimension: str = None
+
+    @property
+    def table_name(self):
+        return f"{ROLLUP_SCHEMA}.ROLLUP_{self.name.upper()}"
+
+    def answers(self, by, aggs, filters, dimension=None):
+        if dimension != self.dimension:
+            return False
+        dims = set(self.dims)
+        if not set(by) <= dims:
+            return False
+        if not set(filters.active_dims()) <= dims | set(self.invariant):
+            return False
+        for col, func in aggs.items():
+            if func == "sum" and col in self.sums:
+                continue
+            if func == "mean" and col in self.means:
+                continue
+            if func == "median" and col in self.medians and set(by) == dims:
+                continue
+            return False
+        return True
+
+    def aggregate(self, cube, by, aggs, filters):
+        rows = cube[filters.mask(cube)]
+        stored = {}
+        for col, func in aggs.items():
+            if func == "mean":
+                stored[f"{col}_SUM"] = "sum"
+                stored[f"{col}_COUNT"] = "sum"
+            else:
+                stored[col] = "sum" if func == "sum" else "first"
+        result = rows.groupby(by, as_index=False, observed=True).agg(stored)
+        for col, func in aggs.items():
+            if func == "mean":
+                result[col] = result.pop(f"{col}_SUM") / result.pop(f"{col}_COUNT")
+        return result[list(by) + list(aggs)]
+
+    def build(self, df):
+        rows = df.drop_duplicates(list(self.distinct_on)) if self.distinct_on else df
+        aggs = {col: (col, "sum") for col in self.sums}
+        aggs.update({f"{col}_SUM": (col, "sum") for col in self.means})
+        aggs.update({f"{col}_COUNT": (col, "count") for col in self.means})
+        aggs.update({col: (col, "median") for col in self.medians})
+        return rows.groupby(list(self.dims), as_index=False, observed=True).agg(**aggs)
+
+    ## The cube for a table that gained rows after PERIOD `after`: groups up to
+    ## it are kept and later ones rebuilt from `df`. Cubes without a month
+    ## dimension rebuild the whole year `after` falls in.
+    def extend(self, cube, df, after):
+        if "PERIOD" in self.dims:
+            kept, recent = cube["PERIOD"] <= after, df["PERIOD"] > after
+        elif "YEAR" in self.dims:
+            kept, recent = cube["YEAR"] < after // 100, df["YEAR"] >= after // 100
+        else:
+            return self.build(df)
+        return pd.concat([cube[kept], self.build(df[recent])], ignore_index=True)
+
+    def build_sql(self):
+        dims = ", ".join(self.dims)
+        select_dims = ", ".join(f"{DERIVED_SQL[d]} AS {d}" if d in DERIVED_SQL else d for d in self.dims)
+        measures = [f"SUM({col}) AS {col}" for col in self.sums]
+        measures += [f"SUM({col}) AS {col}_SUM, COUNT({col}) AS {col}_COUNT" for col in self.means]
+        measures += [f"MEDIAN({col}) AS {col}" for col in self.medians]
+        source = TABLE_NAME
+        if self.distinct_on:
+            columns = ", ".join(dict.fromkeys(self.dims + self.distinct_on + self.medians + self.means + self.sums))
+            source = (
+                f"(SELECT {columns} FROM {TABLE_NAME} "
+                f"QUALIFY ROW_NUMBER() OVER (PARTITION BY {', '.join(self.distinct_on)} ORDER BY MONTH1) = 1)"
+            )
+        return (
+            f"CREATE OR REPLACE TABLE {self.table_name} AS "
+            f"SELECT {select_dims}, {', '.join(measures)}, MARK.{MARK_COLUMN} "
+            f"FROM {source}, (SELECT MAX({PERIOD_SQL}) AS {MARK_COLUMN} FROM {TABLE_NAME}) AS MARK "
+            f"GROUP BY {dims}, MARK.{MARK_COLUMN}"
+        )
+
+
+ROLLUPS = [
+    ## Built from each (CITY, ZIP, YEAR) once, like the income dimension
+    ## (core/dimensions.py), so it only answers queries over that dimension,
+    ## which months and offense categories don't filter
+    Rollup("income_yearly", ("CITY", "YEAR"), medians=("HOUSEHOLDS_MEDIAN_INCOME",),
+           invariant=("MONTH1", "OFFENSE_CATEGORY"), distinct_on=("CITY", "ZIP", "YEAR"), dimension="income"),
+    Rollup("crime_monthly", ("CITY", "YEAR", "MONTH1", "PERIOD", "OFFENSE_CATEGORY"), sums=("TOTAL_CRIMES",)),
+    Rollup("zip_monthly", ("CITY", "ZIP", "LAT", "LNG", "YEAR", "MONTH1", "PERIOD"), sums=("TOTAL_CRIMES",),
+           means=("HOUSEHOLDS_MEDIAN_INCOME",)),
+]
+
+
+## A stored cube and its source mark (None when it has no rows or predates
+## the mark column)
+def _split_mark(cube):
+    through = int(cube[MARK_COLUMN].iloc[0]) if MARK_COLUMN in cube and len(cube) else None
+    return cube.drop(columns=MARK_COLUMN, errors="ignore"), through
+
+
+## {name: (cube, source mark)}
+@st.cache_resource(ttl=DATA_TTL, show_spinner="Loading rollups...")
+def load_rollups(source=ROLLUP_SOURCE):
+    if source == "parquet":
+        return {r.name: _split_mark(pd.read_parquet(os.path.join(ROLLUP_DIR, f"{r.name}.parquet"))) for r in ROLLUPS}
+    if source == "snowflake":
+        return {r.name: _split_mark(fetch_frame(f"SELECT * FROM {r.table_name}")) for r in ROLLUPS}
+    return {}
+
+
+def _stale(rollup, built_through, through):
+    logger.warning(
+        "Not using rollup %s: built through PERIOD %s, the data is through %s. Rebuild it with python -m core.rollups.",
+        rollup.name, built_through, through,
+    )
+
+
+## Rollups for a table version: a cube built through the table's mark is used
+## as is, one built earlier is extended with the table's later rows (from a
+## newer source load or incremental syncs, see core/sync.py), and one built
+## from rows the table doesn't have, or without a mark, is left out
+@st.cache_resource(ttl=DATA_TTL, max_entries=VERSION_ENTRIES, show_spinner=False)
+def _table_rollups(version, _table):
+    stored = load_rollups()
+    cubes = {}
+    for rollup in ROLLUPS:
+        if rollup.name not in stored:
+            continue
+        cube, built_through = stored[rollup.name]
+        if built_through is None or _table.through is None or built_through > _table.through:
+            _stale(rollup, built_through, _table.through)
+        elif built_through == _table.through:
+            cubes[rollup.name] = cube
+        else:
+            cubes[rollup.name] = rollup.extend(cube, _table.frame, built_through)
+    return cubes
+
+
+## Rollups for pushdown queries, which read the source table directly: only
+## cubes built through its current mark
+@st.cache_resource(ttl=DATA_TTL, show_spinner=False)
+def _source_rollups():
+    stored = load_rollups()
+    if not stored:
+        return {}
+    through = run_query(
+        lambda session: session.sql(f"SELECT MAX({PERIOD_SQL}) FROM {TABLE_NAME}").collect()[0][0]
+    )
+    cubes = {}
+    for rollup in ROLLUPS:
+        if rollup.name not in stored:
+            continue
+        cube, built_through = stored[rollup.name]
+        if built_through is None or built_through != through:
+            _stale(rollup, built_through, through)
+        else:
+            cubes[rollup.name] = cube
+    return cubes
+
+
+DATA_CACHES.extend([load_rollups, _table_rollups, _source_rollups])
+
+
+## First (smallest) rollup that can answer the request over `dimension`, with
+## its table. `table` is the TableVersion a local-mode query reads.
+def find_rollup(by, aggs, filters, table=None, dimension=None):
+    if not load_rollups():
+        return None, None
+    cubes = _table_rollups(table.version, table) if table is not None else _source_rollups()
+    for rollup in ROLLUPS:
+        if rollup.name in cubes and rollup.answers(by, aggs, filters, dimension):
+            return rollup, cubes[rollup.name]
+    return None, None
+
+
+def build_rollups(target):
+    if target == "snowflake":
+        session = create_session()
+        for rollup in ROLLUPS:
+            session.sql(rollup.build_sql()).collect()
+            print(f"Built {rollup.table_name}")
+        return
+
+    os.makedirs(ROLLUP_DIR, exist_ok=True)
+    df = load_data()
+    for rollup in ROLLUPS:
+        cube = rollup.build(df)
+        cube[MARK_COLUMN] = high_water_mark(df)
+        path = os.path.join(ROLLUP_DIR, f"{rollup.name}.parquet")
+        cube.to_parquet(path, index=False)
+        print(f"Built {path} ({len(cube)} rows)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize the dashboard rollup tables.")
+    parser.add_argument("--target", choices=["parquet", "snowflake"], default="parquet")
+    build_rollups(parser.parse_args().target)
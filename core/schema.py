@@ -0,0 +1,51 @@
+import pyarrow as pa
+
+from core.periods import PERIOD_SQL
+
+INCOME_BRACKET_COLUMNS = [
+    "HOUSEHOLDS_LESS_THAN_10K", "HOUSEHOLDS_10K_15K", "HOUSEHOLDS_15K_25K", "HOUSEHOLDS_25K_35K",
+    "HOUSEHOLDS_35K_50K", "HOUSEHOLDS_50K_75K", "HOUSEHOLDS_75K_100K",
+    "HOUSEHOLDS_100K_150K", "HOUSEHOLDS_150K_200K", "HOUSEHOLDS_MORE_THAN_200K"
+]
+
+## In-memory dtype of every column a page reads. Anything else in the source
+## table is dropped at load time. float32 keeps ~7 significant digits, which is
+## plenty for incomes, household counts, bracket percentages and map positions.
+SCHEMA = {
+    "CITY": "category",
+    "ZIP": "category",
+    "LAT": "float32",
+    "LNG": "float32",
+    "YEAR": "int16",
+    "MONTH1": "int8",
+    "OFFENSE_CATEGORY": "category",
+    "TOTAL_CRIMES": "int32",
+    "HOUSEHOLDS": "float32",
+    "HOUSEHOLDS_MEDIAN_INCOME": "float32",
+    **{col: "float32" for col in INCOME_BRACKET_COLUMNS},
+}
+
+COLUMNS = list(SCHEMA)
+
+## Columns computed at load time, with their SQL equivalents
+DERIVED_SQL = {"PERIOD": PERIOD_SQL}
+
+
+def memory_mb(df):
+    if isinstance(df, pa.Table):
+        return df.nbytes / 2**20
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+## String columns of an Arrow result as dictionaries, so they arrive in pandas
+## as categoricals (sorted, like astype("category")) instead of object arrays
+def arrow_to_pandas(table):
+    columns = {}
+    for name, values in zip(table.column_names, table.columns):
+        if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+            values = values.dictionary_encode()
+        columns[name] = values
+    df = pa.table(columns).to_pandas()
+    for name in df.select_dtypes("category"):
+        df[name] = df[name].cat.set_categories(sorted(df[name].cat.categories))
+    return df
@@ -0,0 +1,84 @@
+"""Local Parquet snapshot of FINAL_CRIME_WITH_LATLON.
+
+    python -m core.snapshot
+
+exports the table to a zstd-compressed Parquet dataset partitioned by YEAR
+under snapshot_dir. Setting ``data_source = "parquet"`` makes the dashboard
+read that dataset instead of opening a Snowflake session.
+"""
+import argparse
+import itertools
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+
+from core.config import get_setting
+
+SNAPSHOT_DIR = get_setting("snapshot_dir", os.path.join("data", "snapshot"))
+PARTITIONING = ds.partitioning(pa.schema([("YEAR", pa.int16())]), flavor="hive")
+
+
+## Writes an Arrow table, DataFrame or iterable of record batches or tables
+## (written as they arrive, without collecting them first); returns the row
+## count
+def write_snapshot(table, path=SNAPSHOT_DIR):
+    if isinstance(table, pd.DataFrame):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+    if isinstance(table, pa.Table):
+        table = [table]
+    batches = (batch for part in table for batch in (part.to_batches() if isinstance(part, pa.Table) else [part]))
+    first = next(batches)
+    year = first.schema.get_field_index("YEAR")
+    schema = first.schema.set(year, pa.field("YEAR", pa.int16()))
+    rows = 0
+
+    def with_int16_year(batch):
+        nonlocal rows
+        rows += batch.num_rows
+        columns = batch.columns
+        columns[year] = columns[year].cast(pa.int16())
+        return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+    ds.write_dataset(
+        map(with_int16_year, itertools.chain([first], batches)),
+        path,
+        schema=schema,
+        format="parquet",
+        partitioning=PARTITIONING,
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        existing_data_behavior="delete_matching",
+    )
+    return rows
+
+
+## Row count and record batches of the snapshot, for the streaming loader;
+## with `after`, only the rows after that PERIOD (YEAR partitions before it
+## are skipped). Only `columns` are decoded, and the files are memory mapped
+## rather than copied into Python buffers before decoding.
+def scan_snapshot(columns=None, path=SNAPSHOT_DIR, after=None):
+    dataset = ds.dataset(
+        path, format="parquet", partitioning=PARTITIONING, filesystem=fs.LocalFileSystem(use_mmap=True)
+    )
+    rows = None
+    if after is not None:
+        year, month = divmod(after, 100)
+        rows = (ds.field("YEAR") > year) | ((ds.field("YEAR") == year) & (ds.field("MONTH1") > month))
+    return dataset.count_rows(filter=rows), dataset.to_batches(columns=columns, filter=rows)
+
+
+## The table is written batch by batch as Snowflake returns it, so exports
+## never hold the whole source in memory
+def export_snapshot(path=SNAPSHOT_DIR):
+    from core.data import TABLE_NAME, create_session
+
+    rows = write_snapshot(create_session().table(TABLE_NAME).to_arrow_batches(), path)
+    print(f"Wrote {rows} rows of {TABLE_NAME} to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the crime table to a local Parquet snapshot.")
+    parser.add_argument("--path", default=SNAPSHOT_DIR)
+    export_snapshot(parser.parse_args().path)
@@ -0,0 +1,175 @@
+"""Server-side spatial binning for the pydeck maps.
+
+With ``map_binning = "grid"`` or ``"hex"`` the Heatmaps page aggregates the ZIP
+points into square or hexagonal cells with NumPy and sends one row per cell
+to a GridLayer or HexagonLayer, instead of every ZIP point to a HeatmapLayer.
+Cells are about ``map_cell_pixels`` screen pixels wide at the map's zoom.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+import streamlit as st
+
+from core.config import get_setting
+from core.data import DATA_CACHES, DATA_TTL, QUERY_MODE, TABLE_NAME, VERSION_ENTRIES, current_table, fetch_frame
+
+MAP_BINNING = get_setting("map_binning", "off")
+MAP_CELL_PIXELS = get_setting("map_cell_pixels", 32, int)
+
+## "all" draws every selected city's maps; "selector" draws only the city
+## picked on the page, so the other cities are never built or sent
+MAP_LAYOUT = get_setting("map_layout", "all")
+
+METERS_PER_DEGREE = 111_320
+
+## Size of the map panels the view states are fitted to (pydeck's default
+## height, half of the wide layout)
+MAP_WIDTH = 600
+MAP_HEIGHT = 500
+MAX_ZOOM = 12
+
+
+## Degrees of longitude covered by `pixels` at web-mercator zoom `zoom`
+def cell_degrees(zoom, pixels=MAP_CELL_PIXELS):
+    return 360 / (256 * 2 ** zoom) * pixels
+
+
+## Sums (or means) `value` per cell id; returns the cell ids and the aggregate
+def _reduce(cell_ids, values, how):
+    cells, inverse = np.unique(cell_ids, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    valid = ~np.isnan(values)
+    totals = np.bincount(inverse[valid], weights=values[valid], minlength=len(cells))
+    if how == "mean":
+        counts = np.bincount(inverse[valid], minlength=len(cells))
+        totals = np.divide(totals, counts, out=np.full(len(cells), np.nan), where=counts > 0)
+    return cells, totals
+
+
+## Square cells, `size` degrees of longitude wide and equally tall on screen
+def grid_bins(lat, lng, values, size, how="sum"):
+    lat0 = np.cos(np.radians(np.nanmean(lat)))
+    lat_size = size * lat0
+    cell_ids = np.column_stack([np.floor(lng / size), np.floor(lat / lat_size)]).astype("int64")
+    cells, totals = _reduce(cell_ids, values, how)
+    return pd.DataFrame({
+        "LNG": (cells[:, 0] + 0.5) * size,
+        "LAT": (cells[:, 1] + 0.5) * lat_size,
+        "VALUE": totals,
+    })
+
+
+## Pointy-top hexagons of circumradius `size` (in degrees of latitude), binned
+## in a plane where longitude is scaled by cos(latitude)
+def hex_bins(lat, lng, values, size, how="sum"):
+    scale = np.cos(np.radians(np.nanmean(lat)))
+    x = lng * scale / size
+    y = lat / size
+    q = np.sqrt(3) / 3 * x - y / 3
+    r = 2 / 3 * y
+    ## Cube rounding: round all three axes, then fix the one that moved most
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    cells, totals = _reduce(np.column_stack([rq, rr]).astype("int64"), values, how)
+    cq, cr = cells[:, 0], cells[:, 1]
+    return pd.DataFrame({
+        "LNG": size * (np.sqrt(3) * cq + np.sqrt(3) / 2 * cr) / scale,
+        "LAT": size * 1.5 * cr,
+        "VALUE": totals,
+    })
+
+
+## A GridLayer/HexagonLayer over `data` binned at `zoom`; each cell is sent as
+## a single weighted point, so the browser has nothing left to aggregate.
+def binned_layer(data, value, zoom, how="sum", mode=MAP_BINNING, **layer_kwargs):
+    size = cell_degrees(zoom)
+    lat = data["LAT"].to_numpy("float64")
+    lng = data["LNG"].to_numpy("float64")
+    values = data[value].to_numpy("float64")
+    aggregation = pdk.types.String("SUM" if how == "sum" else "MEAN")
+    if mode == "hex":
+        radius = size / np.sqrt(3)
+        cells = hex_bins(lat, lng, values, radius, how)
+        layer_type, extent = "HexagonLayer", {"radius": radius * METERS_PER_DEGREE}
+    else:
+        cells = grid_bins(lat, lng, values, size, how)
+        extent = {"cell_size": size * np.cos(np.radians(np.nanmean(lat))) * METERS_PER_DEGREE}
+        layer_type = "GridLayer"
+    return pdk.Layer(
+        layer_type,
+        data=cells.rename(columns={"VALUE": value}),
+        get_position=["LNG", "LAT"],
+        get_color_weight=value,
+        get_elevation_weight=value,
+        color_aggregation=aggregation,
+        elevation_aggregation=aggregation,
+        **extent,
+        **layer_kwargs,
+    )
+
+
+## Deck that serializes once; cached decks are re-sent on every rerun
+class CachedDeck(pdk.Deck):
+    def to_json(self):
+        if getattr(self, "_json", None) is None:
+            self._json = super().to_json()
+        return self._json
+
+
+## Center and zoom that fit a lat/lng bounding box in a width x height map,
+## the same web-mercator fit deck.gl's fitBounds does
+def fit_view(lat_min, lat_max, lng_min, lng_max, width=MAP_WIDTH, height=MAP_HEIGHT, padding=0.1):
+    def mercator_y(lat):
+        return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+    lng_fraction = (lng_max - lng_min) / 360
+    lat_fraction = (mercator_y(lat_max) - mercator_y(lat_min)) / (2 * math.pi)
+    usable = 1 - 2 * padding
+    zooms = [MAX_ZOOM]
+    if lng_fraction > 0:
+        zooms.append(math.log2(width * usable / 256 / lng_fraction))
+    if lat_fraction > 0:
+        zooms.append(math.log2(height * usable / 256 / lat_fraction))
+    center_y = (mercator_y(lat_max) + mercator_y(lat_min)) / 2
+    return {
+        "lat": math.degrees(2 * math.atan(math.exp(center_y)) - math.pi / 2),
+        "lng": (lng_min + lng_max) / 2,
+        "zoom": max(min(zooms), 1),
+    }
+
+
+## {city: {"lat", "lng", "zoom"}} fitted to each city's ZIP extent, computed
+## once per table version (the current one by default)
+def load_view_states(table=None):
+    if QUERY_MODE == "pushdown":
+        return _view_states(None, None)
+    table = table or current_table()
+    return _view_states(table.version, table)
+
+
+@st.cache_resource(ttl=DATA_TTL, max_entries=VERSION_ENTRIES, show_spinner=False)
+def _view_states(version, _table):
+    if _table is None:
+        extents = fetch_frame(
+            "SELECT CITY, MIN(LAT) AS LAT_MIN, MAX(LAT) AS LAT_MAX, MIN(LNG) AS LNG_MIN, MAX(LNG) AS LNG_MAX "
+            f"FROM {TABLE_NAME} GROUP BY CITY"
+        )
+    else:
+        extents = _table.frame.groupby("CITY", observed=True).agg(
+            LAT_MIN=("LAT", "min"), LAT_MAX=("LAT", "max"), LNG_MIN=("LNG", "min"), LNG_MAX=("LNG", "max")
+        ).reset_index()
+    extents = extents.dropna()
+    return {
+        row.CITY: fit_view(row.LAT_MIN, row.LAT_MAX, row.LNG_MIN, row.LNG_MAX)
+        for row in extents.itertuples(index=False)
+    }
+
+
+DATA_CACHES.append(_view_states)
@@ -0,0 +1,162 @@
+"""Streaming load of the crime table into preallocated column buffers.
+
+Result batches (Snowflake's to_arrow_batches() or the snapshot's record
+batches) are cast to SCHEMA one at a time and copied into one numpy array per
+column, sized from a row count taken before the load. Strings are stored as
+integer codes. Peak memory is the loaded table plus one batch, not the Arrow
+result and the DataFrame side by side.
+
+A row/size budget (load_max_rows, load_max_mb) is checked against that count
+before anything is fetched: over budget, the load is refused, or with
+load_over_budget = "sample" a uniform random sample of the budgeted size is
+loaded instead.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from core.config import get_setting
+from core.periods import period_key
+from core.schema import SCHEMA
+
+LOAD_MAX_ROWS = get_setting("load_max_rows", 0, int)
+LOAD_MAX_MB = get_setting("load_max_mb", 0, float)
+LOAD_OVER_BUDGET = get_setting("load_over_budget", "refuse")
+
+
+class LoadBudgetExceeded(RuntimeError):
+    pass
+
+
+## Bytes one loaded row takes: category columns counted as int32 codes, plus
+## the derived PERIOD key
+def row_bytes():
+    return sum(4 if dtype == "category" else np.dtype(dtype).itemsize for dtype in SCHEMA.values()) + 4
+
+
+## Number of rows to load out of `total`
+def plan_rows(total, max_rows=LOAD_MAX_ROWS, max_mb=LOAD_MAX_MB, over_budget=LOAD_OVER_BUDGET):
+    rows = total
+    if max_rows:
+        rows = min(rows, max_rows)
+    if max_mb:
+        rows = min(rows, int(max_mb * 2**20 // row_bytes()))
+    if rows < total and over_budget != "sample":
+        raise LoadBudgetExceeded(
+            f"The table has {total:,} rows (~{total * row_bytes() / 2**20:,.0f} MB in memory), "
+            f"over the load budget of {rows:,} rows. Raise load_max_rows / load_max_mb "
+            f'or set load_over_budget = "sample".'
+        )
+    return rows
+
+
+def _array(values):
+    if isinstance(values, pa.ChunkedArray):
+        return values.combine_chunks()
+    return values
+
+
+## One numpy array per SCHEMA column, filled batch by batch. Integer columns
+## that turn out to hold nulls are widened to float32 rather than failing.
+class ColumnBuffers:
+    def __init__(self, rows):
+        self.size = 0
+        self.columns = {
+            col: np.empty(rows, "int32" if dtype == "category" else dtype) for col, dtype in SCHEMA.items()
+        }
+        ## Category value -> code, in order of first appearance
+        self.categories = {col: {} for col, dtype in SCHEMA.items() if dtype == "category"}
+
+    ## Grows the buffers if the source returns more rows than it counted
+    def _reserve(self, rows):
+        capacity = len(self.columns["YEAR"])
+        if self.size + rows <= capacity:
+            return
+        capacity = max(self.size + rows, 2 * capacity)
+        for col, values in self.columns.items():
+            grown = np.empty(capacity, values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns[col] = grown
+
+    def _codes(self, col, values):
+        encoded = _array(values).cast(pa.string()).dictionary_encode()
+        lookup = self.categories[col]
+        remap = np.array(
+            [lookup.setdefault(value, len(lookup)) for value in encoded.dictionary.to_pylist()] + [-1],
+            dtype="int32",
+        )
+        ## Nulls point at the trailing -1
+        return remap[encoded.indices.fill_null(len(remap) - 1).to_numpy()]
+
+    def append(self, batch):
+        rows = batch.num_rows
+        self._reserve(rows)
+        end = self.size + rows
+        for col, dtype in SCHEMA.items():
+            values = batch.column(col)
+            if dtype == "category":
+                self.columns[col][self.size:end] = self._codes(col, values)
+                continue
+            target = self.columns[col]
+            if target.dtype.kind == "i" and values.null_count:
+                target = self.columns[col] = target.astype("float32")
+            values = _array(values).cast(pa.from_numpy_dtype(target.dtype))
+            target[self.size:end] = values.to_numpy(zero_copy_only=False)
+        self.size = end
+
+    ## The loaded rows as a DataFrame with sorted categories and PERIOD. With
+    ## sort_by, rows are reordered one column at a time as each buffer is released.
+    def to_frame(self, sort_by=()):
+        columns = {}
+        for col, lookup in self.categories.items():
+            names = np.array(list(lookup), dtype=object)
+            order = np.argsort(names)
+            rank = np.empty(len(order) + 1, "int32")
+            rank[order] = np.arange(len(order))
+            rank[-1] = -1
+            self.columns[col] = rank[self.columns[col][:self.size]]
+            self.categories[col] = pd.Index(names[order], dtype="str")
+
+        order = None
+        if sort_by:
+            ## Missing values last, as in sort_values
+            keys = []
+            for col in reversed(sort_by):
+                values = self.columns[col][:self.size]
+                if col in self.categories:
+                    values = np.where(values < 0, len(self.categories[col]), values)
+                keys.append(values)
+            order = np.lexsort(keys)
+        for col in list(self.columns):
+            values = self.columns.pop(col)[:self.size]
+            if order is not None:
+                values = values[order]
+            if col in self.categories:
+                values = pd.Categorical.from_codes(values, self.categories[col])
+            columns[col] = values
+        df = pd.DataFrame(columns, copy=False)
+        df["PERIOD"] = period_key(df["YEAR"], df["MONTH1"])
+        return df
+
+
+## Loads `rows` rows from an iterator of Arrow tables or record batches. With
+## sample_from (the source's row count), a uniform random sample of that many
+## rows is kept instead. on_progress gets the fraction of the source read.
+def stream_frame(batches, rows, sample_from=None, sort_by=(), on_progress=None, seed=0):
+    total = sample_from or rows
+    keep = None
+    if sample_from and rows < sample_from:
+        keep = np.sort(np.random.default_rng(seed).choice(sample_from, rows, replace=False))
+    buffers = ColumnBuffers(rows)
+    seen = 0
+    streamed_bytes = 0
+    for batch in batches:
+        streamed_bytes += batch.nbytes
+        start, seen = seen, seen + batch.num_rows
+        if keep is not None:
+            lo, hi = np.searchsorted(keep, [start, seen])
+            batch = batch.take(pa.array(keep[lo:hi] - start))
+        buffers.append(batch)
+        if on_progress is not None and total:
+            on_progress(min(seen / total, 1.0))
+    return buffers.to_frame(sort_by), streamed_bytes
@@ -0,0 +1,86 @@
+"""Incremental, append-only sync of the loaded table.
+
+Source rows only ever arrive for new (YEAR, MONTH1) periods, so instead of a
+full reload sync_table() fetches the rows after the table's PERIOD high-water
+mark, merges them into a new frame and swaps that in as the next
+TableVersion. The filter index, sidebar domain, map views, rollups and
+memoized aggregates are all keyed on the version, so they are rebuilt for the
+new table while sessions already reading the old one finish with it.
+
+With sync_interval > 0 a daemon thread syncs every sync_interval seconds for
+as long as the table stays cached. A sampled load (see core/stream.py) is
+never synced; "Refresh Data" reloads it in full.
+"""
+import logging
+import threading
+import time
+import weakref
+
+import pandas as pd
+
+from core.config import get_setting
+from core.data import MEMORY_REPORT, TableVersion, count_source, stream_source
+from core.periods import high_water_mark
+from core.schema import memory_mb
+from core.stream import plan_rows
+
+SYNC_INTERVAL = get_setting("sync_interval", 0, int)
+
+logger = logging.getLogger(__name__)
+
+
+## Appends `new` to `old` as a new frame: categories are unioned (sorted) and
+## rows re-sorted into the (CITY, YEAR, MONTH1) order core.index relies on.
+def merge_frames(old, new):
+    old_columns, new_columns = {}, {}
+    for col in old.columns:
+        if isinstance(old[col].dtype, pd.CategoricalDtype):
+            categories = old[col].cat.categories.union(new[col].cat.categories)
+            old_columns[col] = old[col].cat.set_categories(categories)
+            new_columns[col] = new[col].cat.set_categories(categories)
+        elif old[col].dtype != new[col].dtype:
+            ## An integer column that picked up nulls on one side
+            old_columns[col] = old[col].astype("float32")
+            new_columns[col] = new[col].astype("float32")
+    merged = pd.concat([old.assign(**old_columns), new.assign(**new_columns)], ignore_index=True)
+    return merged.sort_values(["CITY", "YEAR", "MONTH1"], ignore_index=True, kind="stable")
+
+
+## Appends the source rows newer than the live table; returns how many
+def sync_table(live):
+    with live.lock:
+        table = live.current
+        if table.sampled:
+            return 0
+        added = count_source(after=table.through)
+        if not added:
+            return 0
+        plan_rows(len(table.frame) + added, over_budget="refuse")
+        increment, _ = stream_source(added, added, after=table.through)
+        frame = merge_frames(table.frame, increment)
+        live.current = TableVersion(frame, high_water_mark(frame), table.loaded_through)
+    MEMORY_REPORT.update(rows=len(frame), total=MEMORY_REPORT.get("total", 0) + added, after_mb=memory_mb(frame))
+    return added
+
+
+## Holds only a weak reference, so the thread ends once the table is dropped
+## from the cache (TTL expiry or "Refresh Data")
+def _refresh(live_ref):
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        live = live_ref()
+        if live is None:
+            return
+        try:
+            added = sync_table(live)
+        except Exception:
+            logger.exception("Incremental sync failed; keeping the current table")
+        else:
+            if added:
+                logger.info("Synced %d new rows through period %d", added, live.current.through)
+        del live
+
+
+def start_refresher(live):
+    if SYNC_INTERVAL > 0:
+        threading.Thread(target=_refresh, args=(weakref.ref(live),), name="table-sync", daemon=True).start()